@@ -0,0 +1,366 @@
+"""
+Benchmark harness for the Birthday Email System.
+
+Generates synthetic company workbooks (Confidential / Contact Details / Employee Status) and
+runs the full BirthdayEmailSystem pipeline against an in-process SMTP sink that accepts and
+counts messages. Each scenario runs in a fresh process and is timed twice: a cold run (empty
+parsed-workbook cache) and a warm run (cache hit). The report covers per-stage timings (load,
+filter, join, compose, send), peak memory and messages/second.
+
+Usage:
+    python benchmark_birthday_wishes.py --rows 1000,100000 --birthday-density 0.01
+    python benchmark_birthday_wishes.py --rows 1000000 --json results.json --compare baseline.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import smtplib
+import argparse
+import tempfile
+import threading
+import socketserver
+from pathlib import Path
+from datetime import date, timedelta
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+from openpyxl import Workbook
+
+REPO_DIR = Path(__file__).resolve().parent
+STAGES = ['load', 'filter', 'join', 'compose', 'send']
+
+
+# --- Synthetic data --------------------------------------------------------------
+
+def generate_workbook(path: Path, rows: int, birthday_density: float, extra_columns: int = 10,
+                      on: date = None, seed: int = 42) -> int:
+    """
+    Write a company master workbook with `rows` employees, `extra_columns` unrelated HR columns
+    per sheet, and roughly `birthday_density` of them born on `on`'s month/day. Returns the number
+    of rows given that birthday.
+    """
+    on = on or date.today()
+    rng = random.Random(seed)
+    extras = [f"HR_Field_{i}" for i in range(extra_columns)]
+    filler = ['x' * 12] * extra_columns
+
+    wb = Workbook(write_only=True)
+    confidential = wb.create_sheet('Confidential')
+    contact = wb.create_sheet('Contact Details')
+    status = wb.create_sheet('Employee Status')
+    confidential.append(['Emp Id', 'First Name', 'Last Name', 'DOB'] + extras)
+    contact.append(['Emp_Id', 'First_Name', 'Last_Name', 'P_Email1'] + extras)
+    status.append(['EmpID', 'FirstName', 'LastName', 'P_Status'] + extras)
+
+    birthdays = 0
+    for emp_id in range(1, rows + 1):
+        if rng.random() < birthday_density:
+            dob = date(rng.randint(1960, 2000), on.month, min(on.day, 28) if on.month == 2 else on.day)
+            birthdays += 1
+        else:
+            dob = date(1960, 1, 1) + timedelta(days=rng.randint(0, 15000))
+            if (dob.month, dob.day) == (on.month, on.day):
+                dob += timedelta(days=1)
+        confidential.append([emp_id, f"first{emp_id}", f"last{emp_id}", dob] + filler)
+        contact.append([emp_id, f"First{emp_id}", f"Last{emp_id}", f"employee{emp_id}@bench.example.com"] + filler)
+        status.append([emp_id, f"first{emp_id}", f"last{emp_id}", 'A'] + filler)
+
+    wb.save(path)
+    return birthdays
+
+
+def generate_card(path: Path, width: int = 2400, height: int = 1600):
+    """Write a photo-like JPEG card (gradient plus noise, so it does not compress to nothing). Needs Pillow."""
+    from PIL import Image, ImageFilter
+
+    noise = Image.merge('RGB', [Image.effect_noise((width, height), 64) for _ in range(3)])
+    gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    Image.blend(gradient, noise.filter(ImageFilter.GaussianBlur(2)), 0.5).save(path, 'JPEG', quality=95)
+
+
+# --- In-process SMTP sink ----------------------------------------------------------
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: accept every message and count it."""
+
+    def handle(self):
+        sink = self.server
+        self.wfile.write(b"220 bench-sink ESMTP\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line[:4].upper()
+            if cmd == b'EHLO':
+                self.wfile.write(b"250-bench-sink\r\n250-8BITMIME\r\n250 SMTPUTF8\r\n")
+            elif cmd in (b'HELO', b'MAIL', b'RCPT', b'RSET', b'NOOP'):
+                self.wfile.write(b"250 OK\r\n")
+            elif cmd == b'DATA':
+                self.wfile.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                size = 0
+                for data_line in self.rfile:
+                    if data_line in (b".\r\n", b".\n"):
+                        break
+                    size += len(data_line)
+                if sink.latency:
+                    time.sleep(sink.latency)
+                with sink.lock:
+                    sink.messages += 1
+                    sink.bytes += size
+                self.wfile.write(b"250 OK queued\r\n")
+            elif cmd == b'QUIT':
+                self.wfile.write(b"221 Bye\r\n")
+                return
+            else:
+                self.wfile.write(b"502 Command not implemented\r\n")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Local SMTP stand-in on 127.0.0.1 (random port) serving each connection on its own thread."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(('127.0.0.1', 0), _SinkHandler)
+        self.latency = latency
+        self.messages = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, name='smtp-sink', daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+# --- Scenario run (in a fresh process) ---------------------------------------------
+
+def _run_scenario(workbook: str, workdir: str, settings: dict) -> dict:
+    """Run the pipeline cold and warm against a fresh SMTP sink; returns timings and counters."""
+    os.chdir(workdir)
+    sink = SMTPSink(latency=settings['smtp_latency']).start()
+    os.environ.update({
+        'DRY_RUN': 'false',
+        'LOG_LEVEL': 'WARNING',
+        'P_STATUS_FILTER': 'A',
+        'DELAY_BETWEEN_SENDS': '0',
+        'DELAY_BETWEEN_COMPANIES': '0',
+        'SEND_RATE': '0',
+        'SEND_ENGINE': settings['engine'],
+        'RUN_MODE': 'serial',
+        'CACHE_DIR': str(Path(workdir) / 'cache'),
+        'SEND_LOG_DIR': str(Path(workdir) / 'logs'),
+        'LEDGER_ENABLED': 'false',
+        'COMPANY1_SMTP_HOST': '127.0.0.1',
+        'COMPANY1_SMTP_PORT': str(sink.port),
+        'COMPANY1_SMTP_USER': 'bench@bench.example.com',
+        'COMPANY1_SMTP_PASS': 'bench',
+        'COMPANY1_EMAIL_CC': '',
+        'COMPANY1_EMAIL_BCC': '',
+    })
+    sys.path.insert(0, str(REPO_DIR))
+    import send_birthday_wishes as sbw
+
+    class BenchmarkSystem(sbw.BirthdayEmailSystem):
+        """Pipeline with per-stage timers and a plain (no TLS/auth) connection to the sink."""
+
+        def __init__(self):
+            self.timings = defaultdict(float)
+            self.failed_files = []
+            super().__init__()
+            if settings['card_image']:
+                self.company_images['Company1'] = settings['card_image']
+
+        def _timed(self, stage, fn, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.timings[stage] += time.perf_counter() - start
+
+        def _connect_smtp(self, cfg):
+            server = smtplib.SMTP(cfg['smtp_host'], cfg['smtp_port'], timeout=self.config['smtp_timeout'])
+            server.noop()
+            return server
+
+        def _run_serial(self, *args, **kwargs):
+            self.failed_files = super()._run_serial(*args, **kwargs)
+            return self.failed_files
+
+        def load_company_data(self, *args, **kwargs):
+            return self._timed('load', super().load_company_data, *args, **kwargs)
+
+        def filter_birthdays(self, *args, **kwargs):
+            return self._timed('filter', super().filter_birthdays, *args, **kwargs)
+
+        def join_email_data(self, *args, **kwargs):
+            return self._timed('join', super().join_email_data, *args, **kwargs)
+
+        def create_email_message(self, *args, **kwargs):
+            return self._timed('compose', super().create_email_message, *args, **kwargs)
+
+        def send_emails(self, *args, **kwargs):
+            compose_before = self.timings['compose']
+            self._timed('send', super().send_emails, *args, **kwargs)
+            # send = time in send_emails that was not spent composing
+            self.timings['send'] -= self.timings['compose'] - compose_before
+
+    tracemalloc = None
+    try:
+        import resource
+    except ImportError:  # Windows: fall back to Python-level allocation tracking
+        resource = None
+        import tracemalloc
+        tracemalloc.start()
+
+    results = {}
+    for phase in ('cold', 'warm'):
+        app = BenchmarkSystem()
+        before_msgs, before_bytes = sink.messages, sink.bytes
+        start = time.perf_counter()
+        app.run([workbook])
+        total = time.perf_counter() - start
+        messages = sink.messages - before_msgs
+        send_time = app.timings['send']
+        results[phase] = {
+            'total_s': round(total, 4),
+            **{f"{stage}_s": round(app.timings[stage], 4) for stage in STAGES},
+            'messages': messages,
+            'bytes': sink.bytes - before_bytes,
+            'msgs_per_s': round(messages / send_time, 1) if send_time > 0 else None,
+            'failed_files': len(app.failed_files),
+        }
+
+    if settings['card_image']:
+        # the prepared card (from the card cache after the cold run) must be a usable image
+        card = app.prepare_card('Company1')
+        results['card_bytes'] = len(card[0]) if card else 0
+        results['card_max_bytes'] = app.config['card_max_bytes'] if sbw.Image is not None else None
+
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_mb = peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    else:
+        peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    sink.stop()
+    results['peak_mem_mb'] = round(peak_mb, 1)
+    return results
+
+
+# --- Reporting -----------------------------------------------------------------------
+
+def _scenario_problems(scenario: dict, phase: str) -> list:
+    """Why a phase's numbers cannot be trusted: failed files or messages missing at the sink."""
+    r = scenario[phase]
+    problems = []
+    if r.get('failed_files'):
+        problems.append(f"{r['failed_files']} file(s) failed in the pipeline (see the log above)")
+    if 'birthdays' in scenario and r['messages'] != scenario['birthdays']:
+        problems.append(f"sink received {r['messages']} of {scenario['birthdays']} message(s)")
+    if phase == 'warm' and 'card_bytes' in scenario:
+        if not scenario['card_bytes']:
+            problems.append("prepared birthday card is empty")
+        elif scenario['card_max_bytes'] and scenario['card_bytes'] > scenario['card_max_bytes']:
+            problems.append(f"prepared birthday card is {scenario['card_bytes']} bytes, over CARD_MAX_KB")
+    return problems
+
+
+def _print_report(report: dict, baseline: dict = None):
+    header = f"{'rows':>9} {'phase':>5} {'total':>8} " + ' '.join(f"{s:>8}" for s in STAGES) + \
+             f" {'msgs':>7} {'msg/s':>8} {'peakMB':>7}"
+    print(header)
+    print('-' * len(header))
+    for rows, scenario in report['scenarios'].items():
+        for phase in ('cold', 'warm'):
+            r = scenario[phase]
+            line = f"{rows:>9} {phase:>5} {r['total_s']:>8.3f} " + \
+                   ' '.join(f"{r[f'{s}_s']:>8.3f}" for s in STAGES) + \
+                   f" {r['messages']:>7} {str(r['msgs_per_s']):>8} {scenario['peak_mem_mb']:>7}"
+            print(line)
+            for problem in _scenario_problems(scenario, phase):
+                print(f"{'':>9} {'!!':>5} FAILED: {problem}")
+            base = (baseline or {}).get('scenarios', {}).get(rows, {}).get(phase)
+            if base:
+                deltas = []
+                for key in ['total_s'] + [f"{s}_s" for s in STAGES]:
+                    if base.get(key):
+                        deltas.append(f"{key[:-2]} {100.0 * (r[key] - base[key]) / base[key]:+.0f}%")
+                print(f"{'':>9} {'vs':>5} {baseline.get('label') or 'baseline'}: " + ', '.join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Birthday Email System pipeline.")
+    parser.add_argument('--rows', default='1000,100000',
+                        help="Comma-separated employee counts per workbook (e.g. 1000,100000,1000000)")
+    parser.add_argument('--birthday-density', type=float, default=1 / 365,
+                        help="Fraction of employees with a birthday today (default 1/365)")
+    parser.add_argument('--extra-columns', type=int, default=10,
+                        help="Unrelated HR columns added to every sheet")
+    parser.add_argument('--engine', choices=['serial', 'async'], default='serial', help="SEND_ENGINE to use")
+    parser.add_argument('--smtp-latency', type=float, default=0.0,
+                        help="Seconds the SMTP sink waits before accepting each message")
+    parser.add_argument('--card-image', help="Birthday card image to send, or 'generate' for a synthetic "
+                                             "2400x1600 photo card (needs Pillow; default: none, text/HTML only)")
+    parser.add_argument('--workdir', help="Directory for workbooks, cache and logs (default: temporary)")
+    parser.add_argument('--keep', action='store_true', help="Keep the working directory")
+    parser.add_argument('--label', default='', help="Label stored in the JSON report (e.g. a version)")
+    parser.add_argument('--json', help="Write the report to this JSON file")
+    parser.add_argument('--compare', help="Earlier JSON report to show percentage changes against")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix='bday-bench-'))
+    workdir.mkdir(parents=True, exist_ok=True)
+    if args.card_image == 'generate':
+        args.card_image = str(workdir / 'synthetic_card.jpg')
+        generate_card(Path(args.card_image))
+    settings = {'engine': args.engine, 'smtp_latency': args.smtp_latency,
+                'card_image': str(Path(args.card_image).resolve()) if args.card_image else ''}
+    report = {'label': args.label, 'engine': args.engine, 'birthday_density': args.birthday_density,
+              'extra_columns': args.extra_columns, 'date': date.today().isoformat(), 'scenarios': {}}
+
+    try:
+        for rows in [int(r) for r in args.rows.split(',') if r.strip()]:
+            scenario_dir = workdir / f"rows_{rows}"
+            scenario_dir.mkdir(exist_ok=True)
+            workbook = scenario_dir / f"COMPANY1_BENCH_{rows}.xlsx"
+            print(f"Generating {workbook.name} ({rows} rows)...", flush=True)
+            start = time.perf_counter()
+            birthdays = generate_workbook(workbook, rows, args.birthday_density, args.extra_columns)
+            print(f"  {birthdays} birthdays, {time.perf_counter() - start:.1f}s", flush=True)
+
+            # fresh interpreter per scenario so peak memory is not inherited from earlier ones
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                result = pool.submit(_run_scenario, str(workbook), str(scenario_dir), settings).result()
+            result['birthdays'] = birthdays
+            report['scenarios'][str(rows)] = result
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print()
+    _print_report(report, baseline)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+        print(f"\nReport written to {args.json}")
+    failed = [rows for rows, scenario in report['scenarios'].items()
+              if any(_scenario_problems(scenario, phase) for phase in ('cold', 'warm'))]
+    if failed:
+        print(f"\nBenchmark FAILED for {', '.join(failed)} row(s); the timings above are not valid", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
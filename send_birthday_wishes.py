@@ -1,55 +1,1122 @@
 import os
+import re
 import sys
+import argparse
 import time
+import asyncio
+import atexit
 import csv
+import glob
+import io
+import json
+import math
+import hashlib
+import html
+import itertools
 import logging
+import shutil
+import signal
 import smtplib
+import socket
+import sqlite3
+import string
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
-from datetime import datetime, date
-from typing import List, Tuple, Dict
+from datetime import datetime, date, timedelta
+from calendar import isleap
+from typing import Callable, List, Tuple, Dict, Optional
 
 import pandas as pd
+from openpyxl import load_workbook
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email.utils import formataddr, make_msgid
+from email.generator import BytesGenerator
 from email import encoders
 
+try:
+    from zoneinfo import ZoneInfo  # Python 3.9+; on Windows also needs the tzdata package
+except ImportError:
+    ZoneInfo = None
+
+try:
+    import pyarrow  # optional: parquet cache entries and data sources (pip install pyarrow)
+except ImportError:
+    pyarrow = None
+
+try:
+    from PIL import Image, ImageOps  # optional: card optimization (pip install Pillow)
+except ImportError:
+    Image = ImageOps = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 from dotenv import load_dotenv
 load_dotenv()
 
+LOG_FILE = "birthday_emails.log"
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# Concurrent runs tag each line with the worker thread (named after the company)
+CONCURRENT_LOG_FORMAT = '%(asctime)s - %(levelname)s - [%(threadName)s] %(message)s'
+
+# Built-in email bodies. Per-company files in TEMPLATE_DIR (<Company>.txt / <Company>.html,
+# or default.txt / default.html) replace them. Placeholders: {first_name}, {company},
+# {team_name}, {site_text}, {site_html}, {smtp_user}, and {card_html} (HTML only: the inline
+# birthday card; added before </body> when an HTML template leaves it out).
+DEFAULT_TEXT_TEMPLATE = """Dear {first_name},
+
+Here's wishing you a very Happy Birthday on behalf of our {company} Team. Hope you are having a Blast !!
+
+Be Blessed! Have a Great day!
+
+{team_name}
+{site_text}"""
+
+DEFAULT_HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Happy Birthday from {company}</title>
+</head>
+<body style="font-family: Arial, Helvetica, sans-serif; line-height: 1.6; color: #333333; max-width: 600px; margin: 0 auto; padding: 20px; background-color: #ffffff;">
+    <div style="border: 1px solid #e0e0e0; padding: 30px; border-radius: 8px; background-color: #fefefe;">
+        {card_html}
+        <p style="margin: 0 0 15px 0;">Dear {first_name},</p>
+        
+        <p style="margin: 0 0 15px 0;">Here's wishing you a very Happy Birthday on behalf of our <strong>{company} Team</strong>. Hope you are having a Blast !!</p>
+        
+        <p style="margin: 0 0 15px 0;">Be Blessed! Have a Great day!</p>
+        
+        <div style="margin-top: 30px; padding-top: 20px; border-top: 1px solid #e0e0e0;">
+            <p style="margin: 0; font-weight: bold;">{team_name}</p>
+            {site_html}
+        </div>
+
+        <div style="margin-top: 30px; font-size: 12px; color: #888888; text-align: center;">
+             <p style="font-size: 12px; color: #888888; text-align: center;">
+                 Sent with warm wishes from the {company} HR Team.  
+                 Contact: {smtp_user}
+             </p>
+        </div>
+    </div>
+</body>
+</html>"""
+
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+# Longest per-person list logged for invalid addresses before summarizing the rest
+MAX_INVALID_EMAIL_LINES = 50
+
+SEND_LOG_FIELDS = ['Timestamp', 'Recipient', 'First_Name', 'Source_File',
+                   'Company', 'Status', 'Response', 'Message_ID', 'Spam_Score', 'Birthday_Date']
+
+# Card image types sent as-is when Pillow is missing or optimization is off
+CARD_SUBTYPES = {'.jpg': 'jpeg', '.jpeg': 'jpeg', '.png': 'png', '.gif': 'gif'}
+
+# Outbox spool: one manifest per birthday date and company; a sent .eml is renamed to .eml.sent
+CACHE_MANIFEST = 'manifest.json'  # written last: an entry without it is incomplete
+CACHE_TABLES = ('confidential', 'contact', 'status')
+SPOOL_MANIFEST = 'manifest.jsonl'
+SPOOL_SENT_SUFFIX = '.sent'
+SPOOL_CHUNK_SIZE = 250  # messages per compose task; smaller batches are composed in-process
+
+# Stand-in for the recipient's name while pre-rendering templates
+_NAME_SLOT = '\x00first_name\x00'
+
+# Placeholders the text/HTML body templates may use
+TEMPLATE_FIELDS = ('first_name', 'company', 'team_name', 'site_text', 'site_html', 'smtp_user', 'card_html')
+_PLACEHOLDER_RE = re.compile(r'\{(\w+)\}')
+# Braces that are not placeholders: a JS template literal ${...}, or braces in an HTML comment
+_LITERAL_BRACES_RE = re.compile(r'\$\{|<!--(?:(?!-->).)*?[{}]', re.S)
+
+# Company registry used when COMPANY_REGISTRY does not point at a file (see companies.example.json)
+DEFAULT_COMPANY_REGISTRY = {
+    'workbook_globs': [r"C:\path\to\your\excel_files\*_MASTER_EXCEL_HR_*.xlsx"],
+    'companies': [
+        {'name': f'Company{n}', 'image': rf"C:\path\to\your\assets\Company{n}BdayCard.jpg",
+         'site': f"WWW.Company{n}.com"}
+        for n in range(1, 5)
+    ],
+}
+
+# Filename words are split on anything that is not a letter or digit
+_TOKEN_SPLIT_RE = re.compile(r'[^A-Z0-9]+')
+
+
+def _write_atomic(path: str, text: str):
+    """Replace `path` in one step so readers (e.g. textfile collectors) never see a partial file."""
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding='utf-8')
+    os.replace(tmp, target)
+
+
+class JsonLogFormatter(logging.Formatter):
+    """LOG_JSON: one JSON object per line, with company/emp_id/message_id when the record carries them."""
+
+    FIELDS = ('company', 'emp_id', 'message_id')
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {'time': self.formatTime(record), 'level': record.levelname,
+                 'thread': record.threadName, 'message': record.getMessage()}
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value not in (None, ''):
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _log_handlers(fmt: str) -> List[logging.Handler]:
+    """Log file + console handlers, formatted with `fmt` or as JSON lines (LOG_JSON=true)."""
+    if os.getenv('LOG_JSON', 'false').lower() == 'true':
+        formatter = JsonLogFormatter()
+    else:
+        formatter = logging.Formatter(fmt)
+    handlers = [logging.FileHandler(LOG_FILE, mode='a', encoding='utf-8'), logging.StreamHandler(sys.stdout)]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def _start_log_listener(handlers: List[logging.Handler]) -> QueueHandler:
+    """
+    LOG_ASYNC: logging calls only put the record on a queue; a background thread formats and
+    writes it to `handlers`. The queue is drained when the listener is stopped at exit.
+    """
+    log_queue = SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    handler = QueueHandler(log_queue)
+    handler.setFormatter(logging.Formatter('%(message)s'))  # the listener's handlers add the real format
+    return handler
+
+
+def _cache_column_kind(dtype) -> str:
+    """How a column is written to a CSV cache entry: 'bool', 'number', 'datetime' or 'json' (anything else)."""
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'bool'
+    if pd.api.types.is_numeric_dtype(dtype):
+        return 'number'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'datetime'
+    return 'json'
+
+
+def _encode_cache_cell(value) -> str:
+    """One CSV cache cell as JSON, keeping its type (text, number, timestamp, None or NaN); '' is NaN/NaT."""
+    if value is None:
+        return 'null'
+    if isinstance(value, float) and math.isnan(value) or value is pd.NaT or value is pd.NA:
+        return ''
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return json.dumps({'$datetime': value.isoformat()})
+    if isinstance(value, date):
+        return json.dumps({'$date': value.isoformat()})
+    if hasattr(value, 'item'):  # numpy scalar
+        value = value.item()
+    return json.dumps(value, default=str)
+
+
+def _decode_cache_cell(text: str):
+    if text == '':
+        return math.nan
+    value = json.loads(text)
+    if isinstance(value, dict) and '$datetime' in value:
+        return pd.Timestamp(value['$datetime'])
+    if isinstance(value, dict) and '$date' in value:
+        return date.fromisoformat(value['$date'])
+    return value
+
+
+def _template_placeholders(template: str) -> Tuple[bool, set]:
+    """
+    (format_style, placeholder names) of a body template. A template that is valid for str.format
+    and only uses known placeholders (literal braces doubled) is format-style; anything else, such
+    as HTML with a <style> block, is literal text with {placeholder}s in it.
+    """
+    try:
+        names = {name for _, name, _, _ in string.Formatter().parse(template) if name is not None}
+    except ValueError:
+        names = None
+    if names is not None and names <= set(TEMPLATE_FIELDS):
+        return True, names
+    return False, set(_PLACEHOLDER_RE.findall(template))
+
+
+def _fill_template(template: str, fields: Dict[str, str]) -> str:
+    """Render a body template: str.format for format-style ones, else replace only the {placeholder}s."""
+    if _template_placeholders(template)[0]:
+        return template.format(**fields)
+    return _PLACEHOLDER_RE.sub(lambda m: str(fields.get(m.group(1), m.group(0))), template)
+
+
+def _template_problems(template: str) -> Tuple[bool, List[str]]:
+    """
+    (strict, problems): the {placeholder}s in a body template that would not be filled in.
+    A template whose braces are all plain {name} fields (str.format style) is strict: an unknown
+    name there is a typo. In literal-style templates (CSS, a JS `${name}`, a {token} in an HTML
+    comment) the braces may be meant as written, so unknown names are only worth a warning.
+    """
+    unknown = sorted(_template_placeholders(template)[1] - set(TEMPLATE_FIELDS))
+    try:
+        fields = [(name, spec, conversion)
+                  for _, name, spec, conversion in string.Formatter().parse(template) if name is not None]
+        strict = not _LITERAL_BRACES_RE.search(template) and all(
+            re.fullmatch(r'\w+', name) and not spec and conversion is None for name, spec, conversion in fields)
+    except ValueError:
+        strict = False
+    return strict, [f"unknown placeholder {{{name}}}" for name in unknown]
+
+
+def _optimize_card(data: bytes, max_width: int, max_bytes: int, quality: int) -> Tuple[bytes, str]:
+    """
+    Downscale a card to at most `max_width` pixels wide and recompress it with Pillow: PNG when
+    it has transparency, else progressive JPEG, lowering the quality (down to 50, or `quality`
+    when that is lower) and then the size until it fits in `max_bytes`. Returns (image bytes,
+    file extension); raises ValueError rather than return an empty or undecodable image.
+    """
+    quality = max(1, min(quality, 95))
+    with Image.open(io.BytesIO(data)) as source:
+        img = ImageOps.exif_transpose(source)
+    if img.width > max_width:
+        img = img.resize((max_width, max(1, round(img.height * max_width / img.width))), Image.LANCZOS)
+    transparent = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+    if not transparent:
+        img = img.convert('RGB')
+    while True:
+        buf = io.BytesIO()
+        if transparent:
+            img.save(buf, 'PNG', optimize=True)
+        else:
+            for q in range(quality, min(quality, 50) - 1, -10):
+                buf = io.BytesIO()
+                img.save(buf, 'JPEG', quality=q, optimize=True, progressive=True)
+                if buf.tell() <= max_bytes:
+                    break
+        if buf.tell() <= max_bytes or img.width <= 200:
+            break
+        img = img.resize((int(img.width * 0.8), max(1, int(img.height * 0.8))), Image.LANCZOS)
+    result = buf.getvalue()
+    if not result:
+        raise ValueError("recompressed card is empty")
+    with Image.open(io.BytesIO(result)) as check:
+        check.verify()
+    return result, '.png' if transparent else '.jpg'
+
+
+@contextmanager
+def _locked_file(path: Path):
+    """Hold an exclusive inter-process lock on `path` (created if missing) while the block runs."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _init_parse_worker(role: str = 'parse'):
+    """
+    Process-pool initializer (parse and compose pools). Forked workers inherit the parent's log
+    handlers (minus the LOG_ASYNC listener thread, so its queue handler is replaced); spawned
+    ones (Windows) start bare, so point them at the same log file.
+    """
+    threading.current_thread().name = f"{role}-{os.getpid()}"
+    root = logging.getLogger()
+    for handler in [h for h in root.handlers if isinstance(h, QueueHandler)]:
+        root.removeHandler(handler)
+    if not root.handlers:
+        logging.basicConfig(level=logging.INFO, handlers=_log_handlers(LOG_FORMAT))
+
+
+class DataSource(ABC):
+    """
+    One company's HR data as the three logical tables the pipeline uses. read() returns each
+    requested table with its headers mapped to the pipeline's names by `canonical`
+    (BirthdayEmailSystem._canonical_column_name) and unmapped columns dropped, optionally only
+    `columns` and only rows whose Emp_Id is in `emp_ids`. Required-column checks and DOB parsing
+    happen afterwards, the same way for every source.
+    """
+    TABLES = ('Confidential', 'Contact Details', 'Employee Status')
+
+    def __init__(self, path: str, canonical: Callable[[str], Optional[str]]):
+        self.path = Path(path)
+        self.canonical = canonical
+
+    @classmethod
+    @abstractmethod
+    def handles(cls, path: Path) -> bool:
+        """Whether this implementation reads `path` (open_data_source tries DATA_SOURCES in order)."""
+
+    def files(self) -> List[Path]:
+        """Files whose content makes up this source (cache keys and change detection)."""
+        return [self.path]
+
+    @abstractmethod
+    def read(self, tables: Tuple[str, ...], columns: Optional[List[str]] = None,
+             emp_ids: Optional[set] = None) -> Dict[str, pd.DataFrame]:
+        """{table: frame} for each of `tables`; a missing table raises ValueError."""
+
+    def _keep(self, headers, columns: Optional[List[str]] = None) -> Dict[str, int]:
+        """{pipeline name: header position}; the first header mapping to a name wins."""
+        keep: Dict[str, int] = {}
+        for pos, raw in enumerate(headers):
+            if raw is None:
+                continue
+            name = self.canonical(str(raw).strip())
+            if name and name not in keep and (columns is None or name in columns):
+                keep[name] = pos
+        return keep
+
+    @staticmethod
+    def _finish(df: pd.DataFrame, names: List[str], emp_ids: Optional[set]) -> pd.DataFrame:
+        df.columns = names
+        df = df.dropna(how='all')
+        if emp_ids is not None and 'Emp_Id' in df.columns:
+            df = df[df['Emp_Id'].isin(emp_ids)]
+        return df.reset_index(drop=True)
+
+
+class ExcelSource(DataSource):
+    """Workbook with Confidential / Contact Details / Employee Status sheets, streamed read-only."""
+
+    @classmethod
+    def handles(cls, path: Path) -> bool:
+        return path.is_file() and path.suffix.lower() in ('.xlsx', '.xlsm')
+
+    def read(self, tables, columns=None, emp_ids=None):
+        wb = load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            frames = {}
+            for sheet_name in tables:
+                if sheet_name not in wb.sheetnames:
+                    raise ValueError(f"Worksheet named '{sheet_name}' not found")
+                frames[sheet_name] = self._read_sheet(wb[sheet_name], columns, emp_ids)
+            return frames
+        finally:
+            wb.close()
+
+    def _read_sheet(self, ws, columns: Optional[List[str]], emp_ids: Optional[set]) -> pd.DataFrame:
+        """
+        Stream a worksheet row by row, collecting only the mapped columns (and rows). Memory grows
+        with rows x kept columns; unrelated HR columns are dropped as each row is read.
+        """
+        rows = ws.iter_rows(values_only=True)
+        keep = self._keep(next(rows, None) or (), columns)
+
+        names = list(keep)
+        positions = list(keep.values())
+        columns_data: Dict[str, list] = {name: [] for name in names}
+        emp_pos = names.index('Emp_Id') if emp_ids is not None and 'Emp_Id' in keep else None
+        for row in rows:
+            values = [row[pos] if pos < len(row) else None for pos in positions]
+            if all(v is None for v in values):
+                continue
+            if emp_pos is not None and values[emp_pos] not in emp_ids:
+                continue
+            for name, value in zip(names, values):
+                columns_data[name].append(value)
+
+        return pd.DataFrame(columns_data, columns=names)
+
+
+class _TableFilesSource(DataSource):
+    """A directory holding one file per table, e.g. Confidential.csv, Contact_Details.csv, ..."""
+    suffix = ''
+
+    @classmethod
+    def handles(cls, path: Path) -> bool:
+        return path.is_dir() and any(p.suffix.lower() == cls.suffix for p in path.iterdir())
+
+    def _table_files(self) -> Dict[str, Path]:
+        found = {p.stem.lower().replace(' ', '_'): p for p in self.path.iterdir() if p.suffix.lower() == self.suffix}
+        return {table: found[table.lower().replace(' ', '_')]
+                for table in self.TABLES if table.lower().replace(' ', '_') in found}
+
+    def files(self) -> List[Path]:
+        return sorted(self._table_files().values())
+
+    def read(self, tables, columns=None, emp_ids=None):
+        files = self._table_files()
+        frames = {}
+        for table in tables:
+            if table not in files:
+                raise ValueError(f"Table file '{table}{self.suffix}' not found in {self.path}")
+            frames[table] = self._read_table(files[table], columns, emp_ids)
+        return frames
+
+    @abstractmethod
+    def _read_table(self, path: Path, columns, emp_ids) -> pd.DataFrame:
+        """One table file, mapped and filtered like DataSource.read."""
+
+
+class CsvSource(_TableFilesSource):
+    suffix = '.csv'
+
+    def _read_table(self, path, columns, emp_ids):
+        headers = list(pd.read_csv(path, nrows=0, encoding='utf-8-sig').columns)
+        keep = self._keep(headers, columns)
+        raw_names = [headers[pos] for pos in keep.values()]
+        df = pd.read_csv(path, usecols=raw_names, encoding='utf-8-sig')[raw_names]
+        return self._finish(df, list(keep), emp_ids)
+
+
+class ParquetSource(_TableFilesSource):
+    suffix = '.parquet'
+
+    def _read_table(self, path, columns, emp_ids):
+        try:
+            import pyarrow.parquet as pq
+            headers = pq.ParquetFile(path).schema_arrow.names
+        except ImportError:
+            headers = list(pd.read_parquet(path).columns)  # other engines: no schema-only read
+        keep = self._keep(headers, columns)
+        raw_names = [headers[pos] for pos in keep.values()]
+        df = pd.read_parquet(path, columns=raw_names)[raw_names]
+        return self._finish(df, list(keep), emp_ids)
+
+
+class SqliteSource(DataSource):
+    """SQLite database with tables named Confidential, Contact Details (or Contact_Details), ..."""
+    # bound parameters per IN (...) query, below SQLite's historical limit of 999
+    MAX_PARAMS = 900
+
+    @classmethod
+    def handles(cls, path: Path) -> bool:
+        return path.is_file() and path.suffix.lower() in ('.db', '.sqlite', '.sqlite3')
+
+    def files(self) -> List[Path]:
+        wal = self.path.with_name(self.path.name + '-wal')
+        return [self.path] + ([wal] if wal.exists() else [])
+
+    def read(self, tables, columns=None, emp_ids=None):
+        conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            existing = {name.lower().replace(' ', '_'): name
+                        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+            frames = {}
+            for table in tables:
+                name = existing.get(table.lower().replace(' ', '_'))
+                if name is None:
+                    raise ValueError(f"Table '{table}' not found in {self.path}")
+                frames[table] = self._read_table(conn, name, columns, emp_ids)
+            return frames
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _quote(identifier: str) -> str:
+        return '"' + str(identifier).replace('"', '""') + '"'
+
+    def _read_table(self, conn, table: str, columns, emp_ids) -> pd.DataFrame:
+        quote = self._quote
+        headers = [row[1] for row in conn.execute(f"PRAGMA table_info({quote(table)})")]
+        keep = self._keep(headers, columns)
+        if not keep:
+            return pd.DataFrame()
+        select = f"SELECT {', '.join(quote(headers[pos]) for pos in keep.values())} FROM {quote(table)}"
+        if emp_ids is None or 'Emp_Id' not in keep:
+            df = pd.read_sql_query(select, conn)
+        else:
+            # only the wanted employees; Emp_Id may be stored as text or integer
+            where = f" WHERE {quote(headers[keep['Emp_Id']])} IN "
+            ids = list(emp_ids)
+            chunks = [ids[i:i + self.MAX_PARAMS] for i in range(0, len(ids), self.MAX_PARAMS)] or [[]]
+            df = pd.concat([pd.read_sql_query(select + where + f"({', '.join('?' * len(chunk)) or 'NULL'})", conn,
+                                              params=chunk) for chunk in chunks], ignore_index=True)
+        return self._finish(df, list(keep), emp_ids)
+
+
+# Tried in order by open_data_source()
+DATA_SOURCES = [ExcelSource, SqliteSource, CsvSource, ParquetSource]
+
+
+def open_data_source(path: str, canonical: Callable[[str], Optional[str]]) -> DataSource:
+    """Pick the DataSource implementation for a path (file suffix, or the table files in a directory)."""
+    for source_cls in DATA_SOURCES:
+        if source_cls.handles(Path(path)):
+            return source_cls(path, canonical)
+    raise ValueError(f"Unsupported data source: {path} (expected .xlsx/.xlsm, .db/.sqlite/.sqlite3, "
+                     f"or a directory of .csv or .parquet table files)")
+
+
+class CompanyTemplate:
+    """
+    Per-company message template, built once per run. Holds the static headers, the text/HTML
+    bodies and subject pre-rendered around the recipient's name, and the already base64-encoded
+    attachment parts, so composing a message only substitutes the name and a new Message-ID.
+    """
+
+    def __init__(self, company: str, cfg: dict, text_template: str, html_template: str,
+                 site_text: str, attachments: List[MIMEBase], inline_parts: List[MIMEBase] = (),
+                 card_html: str = ''):
+        self.company = company
+        self.team_name = cfg['team_name_template'].format(company=company)
+        self.from_header = formataddr((self.team_name, cfg['smtp_user']))
+        self.smtp_user = cfg['smtp_user']
+        # digest mode: watchers get one summary per batch instead of a copy of every email
+        self.cc_header = ', '.join(cfg['email_cc']) if cfg.get('cc_mode') != 'digest' else ''
+        self.attachments = attachments
+        # images the HTML body shows by cid: (multipart/related)
+        self.inline_parts = list(inline_parts)
+
+        rep_domain = cfg.get('email_reputation_domain')
+        if not rep_domain:
+            try:
+                rep_domain = cfg['smtp_user'].split('@', 1)[1]
+            except Exception:
+                rep_domain = 'localhost'
+        self.rep_domain = rep_domain
+
+        fields = {
+            'first_name': _NAME_SLOT,
+            'company': company,
+            'team_name': self.team_name,
+            'site_text': site_text,
+            'site_html': f'<p style="margin: 5px 0 0 0; color: #666666;">{site_text}</p>' if site_text else '',
+            'smtp_user': cfg['smtp_user'],
+            'card_html': card_html,
+        }
+        if card_html and '{card_html}' not in html_template:
+            body_end = html_template.lower().rfind('</body>')
+            body_end = body_end if body_end >= 0 else len(html_template)
+            html_template = html_template[:body_end] + '{card_html}\n' + html_template[body_end:]
+        subject_template = cfg.get('subject_template', '🎉 Happy Birthday, {first_name}! - {company} Team')
+        self.subject_parts = subject_template.format(first_name=_NAME_SLOT, company=company).split(_NAME_SLOT)
+        self.text_parts = _fill_template(text_template, fields).rstrip().split(_NAME_SLOT)
+        self.html_parts = _fill_template(html_template, fields).rstrip().split(_NAME_SLOT)
+
+    def render(self, first_name: str) -> Tuple[str, str, str]:
+        """Return (subject, text_body, html_body) for one recipient."""
+        return (first_name.join(self.subject_parts),
+                first_name.join(self.text_parts),
+                first_name.join(self.html_parts))
+
+
+class SendLogWriter:
+    """
+    Long-lived sink for the per-day send-attempt CSV files (<log_dir>/birthday_sends_YYYY-MM-DD.csv).
+    Rows are buffered in memory and appended in batches by a background thread, every
+    `flush_interval` seconds or as soon as `batch_size` rows are waiting. close() (also registered
+    with atexit) flushes whatever is left.
+    """
+
+    def __init__(self, log_dir: str, flush_interval: float = 2.0, batch_size: int = 100,
+                 logger: Optional[logging.Logger] = None):
+        self.log_dir = Path(log_dir)
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.logger = logger or logging.getLogger(__name__)
+        self._rows: List[Tuple[str, dict]] = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='send-log-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def path_for(self, day: str) -> Path:
+        return self.log_dir / f"birthday_sends_{day}.csv"
+
+    def write(self, row: dict):
+        """Queue one row; Timestamp and the target file's day are taken now."""
+        now = datetime.now()
+        row = dict(row, Timestamp=now.strftime("%Y-%m-%d %H:%M:%S"))
+        with self._cond:
+            self._rows.append((now.strftime("%Y-%m-%d"), row))
+            if len(self._rows) >= self.batch_size:
+                self._cond.notify()
+
+    def flush(self):
+        """Append all buffered rows to their per-day files."""
+        with self._flush_lock:
+            with self._cond:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return
+
+            by_day: Dict[str, List[dict]] = {}
+            for day, row in rows:
+                by_day.setdefault(day, []).append(row)
+
+            for day, day_rows in by_day.items():
+                path = self.path_for(day)
+                try:
+                    # other processes (shard workers) may append to the same file
+                    with _locked_file(path.with_name(path.name + '.lock')), \
+                            open(path, 'a', newline='', encoding='utf-8') as f:
+                        # keep appending in the column layout the day's file was started with
+                        fieldnames = self._fieldnames(path, f)
+                        buf = io.StringIO()
+                        writer = csv.DictWriter(buf, fieldnames=fieldnames, extrasaction='ignore')
+                        if f.tell() == 0:
+                            writer.writeheader()
+                        writer.writerows(day_rows)
+                        f.write(buf.getvalue())
+                except Exception as e:
+                    self.logger.error(f"Error writing to log file: {e}")
+
+    @staticmethod
+    def _fieldnames(path: Path, f) -> List[str]:
+        if f.tell() == 0:
+            return SEND_LOG_FIELDS
+        with open(path, newline='', encoding='utf-8') as existing:
+            return next(csv.reader(existing), None) or SEND_LOG_FIELDS
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=max(self.flush_interval, 1.0) + 5)
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._rows) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+
+class SendLedger:
+    """
+    Durable SQLite record of successful sends, keyed by (send_date, company, email). A row is
+    committed as soon as its send succeeds, so a rerun after a crash can skip everyone already
+    greeted. completed() returns one company's emails for a date as a set for O(1) checks.
+    """
+
+    def __init__(self, path: str, journal_mode: str = 'WAL'):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            # WAL needs shared memory, so workers on several machines use a rollback journal
+            self._conn.execute(f"PRAGMA journal_mode={journal_mode}")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sends ("
+                " send_date TEXT NOT NULL, company TEXT NOT NULL, email TEXT NOT NULL,"
+                " emp_id TEXT, message_id TEXT, sent_at TEXT NOT NULL,"
+                " PRIMARY KEY (send_date, company, email))"
+            )
+
+    @staticmethod
+    def normalize(email: str) -> str:
+        return str(email).strip().lower()
+
+    def completed(self, send_date: str, company: str) -> set:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT email FROM sends WHERE send_date = ? AND company = ?", (send_date, company)
+            ).fetchall()
+        return {email for (email,) in rows}
+
+    def record(self, send_date: str, company: str, email: str, emp_id: str = "", message_id: str = ""):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sends (send_date, company, email, emp_id, message_id, sent_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (send_date, company, self.normalize(email), str(emp_id), message_id,
+                 datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ShardLeaseStore:
+    """
+    SQLite store through which several worker processes, or machines sharing a filesystem, split
+    one file's recipients (SHARD_ENABLED). Shards are leased for `lease_seconds` and renewed
+    while they are being sent. A lease that runs out (worker crashed or hung) can be claimed by
+    another worker. Uses a rollback journal rather than WAL so it also works on network shares.
+    """
+
+    def __init__(self, path: str, lease_seconds: float):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), timeout=60, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=DELETE")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS shards ("
+                " run_key TEXT NOT NULL, source TEXT NOT NULL, shard INTEGER NOT NULL,"
+                " state TEXT NOT NULL DEFAULT 'pending', owner TEXT, lease_until REAL,"
+                " claims INTEGER NOT NULL DEFAULT 0, finished_at TEXT,"
+                " PRIMARY KEY (run_key, source, shard))"
+            )
+            # per-recipient outcome of finished shards, for the one CC/BCC digest of the run
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS shard_results ("
+                " run_key TEXT NOT NULL, source TEXT NOT NULL, shard INTEGER NOT NULL,"
+                " birthday_date TEXT NOT NULL, status TEXT NOT NULL, first_name TEXT, recipient TEXT,"
+                " emp_id TEXT, message_id TEXT)"
+            )
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def register(self, run_key: str, source: str, shard_count: int, rerun: bool = False) -> str:
+        """
+        Join the run for `source`, creating its shards: 'joined'. When every shard is already done
+        the run is left alone ('finished'), so a late worker does not repeat it, unless `rerun`
+        (--rerun) asks for a new run: the shards are reset to pending and the send ledger decides
+        who was already greeted ('restarted').
+        """
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR IGNORE INTO shards (run_key, source, shard) VALUES (?, ?, ?)",
+                             [(run_key, source, shard) for shard in range(shard_count)])
+            open_shards = conn.execute("SELECT COUNT(*) FROM shards WHERE run_key = ? AND source = ?"
+                                       " AND state != 'done'", (run_key, source)).fetchone()[0]
+            if open_shards:
+                return 'joined'
+            if not rerun:
+                return 'finished'
+            conn.execute("UPDATE shards SET state = 'pending', owner = NULL, lease_until = NULL, finished_at = NULL"
+                         " WHERE run_key = ? AND source = ?", (run_key, source))
+            conn.execute("DELETE FROM shard_results WHERE run_key = ? AND source = ?", (run_key, source))
+        return 'restarted'
+
+    def claim(self, run_key: str, source: str, owner: str) -> Optional[Tuple[int, Optional[str]]]:
+        """Lease the next pending (or expired) shard: (shard, previous owner), or None."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT shard, owner FROM shards WHERE run_key = ? AND source = ?"
+                " AND (state = 'pending' OR (state = 'leased' AND lease_until < ?)) ORDER BY shard LIMIT 1",
+                (run_key, source, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE shards SET state = 'leased', owner = ?, lease_until = ?, claims = claims + 1"
+                         " WHERE run_key = ? AND source = ? AND shard = ?",
+                         (owner, now + self.lease_seconds, run_key, source, row[0]))
+        return row[0], row[1]
+
+    def renew(self, run_key: str, source: str, shard: int, owner: str) -> bool:
+        """Extend a lease; False when it has been taken over by another worker."""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE shards SET lease_until = ? WHERE run_key = ? AND source = ? AND shard = ?"
+                " AND owner = ? AND state = 'leased'",
+                (time.time() + self.lease_seconds, run_key, source, shard, owner))
+        return cursor.rowcount == 1
+
+    def finish(self, run_key: str, source: str, shard: int, owner: str, results: List[dict] = ()) -> bool:
+        """
+        Mark a shard done and store its sent/failed items. True for exactly one caller: the one
+        that finished the last open shard of the run.
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute("UPDATE shards SET state = 'done', lease_until = NULL, finished_at = ?"
+                                  " WHERE run_key = ? AND source = ? AND shard = ? AND owner = ? AND state = 'leased'",
+                                  (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), run_key, source, shard, owner))
+            if cursor.rowcount != 1:
+                return False
+            conn.execute("DELETE FROM shard_results WHERE run_key = ? AND source = ? AND shard = ?",
+                         (run_key, source, shard))
+            conn.executemany(
+                "INSERT INTO shard_results (run_key, source, shard, birthday_date, status, first_name, recipient,"
+                " emp_id, message_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(run_key, source, shard, item['birthday_date'].isoformat(), item['status'], str(item['first_name']),
+                  str(item['recipient']), str(item['emp_id']), item.get('message_id') or '') for item in results])
+            open_shards = conn.execute("SELECT COUNT(*) FROM shards WHERE run_key = ? AND source = ?"
+                                       " AND state != 'done'", (run_key, source)).fetchone()[0]
+        return open_shards == 0
+
+    def results(self, run_key: str, source: str) -> List[dict]:
+        """Items stored by finish() for every shard of the run, in shard order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT birthday_date, status, first_name, recipient, emp_id, message_id FROM shard_results"
+                " WHERE run_key = ? AND source = ? ORDER BY shard, rowid", (run_key, source)).fetchall()
+        return [{'birthday_date': date.fromisoformat(row[0]), 'status': row[1], 'first_name': row[2],
+                 'recipient': row[3], 'emp_id': row[4], 'message_id': row[5]} for row in rows]
+
+    def release(self, run_key: str, source: str, shard: int, owner: str):
+        """Hand a shard back right away (e.g. SMTP unreachable) instead of waiting for the lease to expire."""
+        with self._transaction() as conn:
+            conn.execute("UPDATE shards SET state = 'pending', owner = NULL, lease_until = NULL"
+                         " WHERE run_key = ? AND source = ? AND shard = ? AND owner = ?",
+                         (run_key, source, shard, owner))
+
+    def next_expiry(self, run_key: str, source: str) -> Optional[float]:
+        """Earliest lease expiry among shards other workers still hold, or None when all are done."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*), MIN(lease_until) FROM shards WHERE run_key = ? AND source = ? AND state != 'done'",
+                (run_key, source)).fetchone()
+        if not row[0]:
+            return None
+        return row[1] if row[1] is not None else time.time()
+
+
+class RecipientIndex:
+    """
+    Run-wide claims on recipients across companies (DEDUP_ACROSS_COMPANIES). The first company to
+    claim a key greets that person; later claims from other companies are refused. Claims are
+    made in one locked step per batch, so concurrent send threads can share one index.
+    """
+
+    def __init__(self):
+        self._owners: Dict[tuple, str] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, company: str, keys: List[tuple]) -> List[str]:
+        """Claim `keys` for `company`; returns the owning company of each key."""
+        with self._lock:
+            return [self._owners.setdefault(key, company) for key in keys]
+
+
+class TokenBucket:
+    """Async token bucket: refills `rate` tokens per second and holds at most `burst` (rate <= 0 means unlimited)."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AdaptiveRateController:
+    """
+    AIMD send rate for one SMTP relay (RATE_CONTROL=adaptive), shared by every company and
+    connection that uses it. Each clean reply within `latency_target` seconds raises the rate by
+    about `increase` msgs/sec for every second of sending; slower replies hold it. A throttling
+    signal (421/4xx reply, dropped connection, 4xx-refused recipients) multiplies it by `backoff`,
+    at most once per second so one burst of failures counts once. Thread-safe.
+    """
+
+    def __init__(self, rate: float, increase: float, backoff: float, latency_target: float):
+        self.rate = rate
+        self.increase = increase
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self._next_slot = 0.0
+        self._last_backoff = 0.0
+        self._lock = threading.Lock()
+
+    def delay(self, min_rate: float, max_rate: float) -> float:
+        """Reserve the next send slot at the current rate; returns the seconds to wait for it."""
+        with self._lock:
+            self.rate = min(max(self.rate, min_rate), max_rate)
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.rate
+            return slot - now
+
+    def success(self, latency: float, max_rate: float):
+        with self._lock:
+            if latency <= self.latency_target:
+                self.rate = min(max_rate, self.rate + self.increase / self.rate)
+
+    def throttled(self, min_rate: float) -> Optional[Tuple[float, float]]:
+        """Back off; returns (old, new) rate, or None when a backoff already happened this second."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_backoff < 1.0:
+                return None
+            self._last_backoff = now
+            old = self.rate
+            self.rate = max(min_rate, self.rate * self.backoff)
+            self._next_slot = max(self._next_slot, now + 1.0 / self.rate)
+            return old, self.rate
+
+
+class RunMetrics:
+    """
+    Per-run stage timings and counters, labelled by company. Stages are timed with
+    `with metrics.timer(stage, company):` (count, total and max seconds); counters are bumped with
+    incr(name, company, value, **labels). export() writes a JSON summary and/or a Prometheus
+    textfile-collector file, each replaced atomically.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.stages: Dict[Tuple[str, str], List[float]] = {}  # (stage, company) -> [count, total, max]
+        self.counters: Dict[Tuple[str, str, tuple], float] = {}  # (name, company, labels) -> value
+
+    @contextmanager
+    def timer(self, stage: str, company: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, company, time.perf_counter() - start)
+
+    def observe(self, stage: str, company: str, seconds: float):
+        with self._lock:
+            entry = self.stages.setdefault((stage, company), [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def incr(self, name: str, company: str, value: float = 1, **labels):
+        key = (name, company, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self) -> dict:
+        """Plain-data copy (picklable) for merge() and export."""
+        with self._lock:
+            return {
+                'stages': [{'stage': stage, 'company': company, 'count': count,
+                            'total_seconds': round(total, 6), 'max_seconds': round(peak, 6)}
+                           for (stage, company), (count, total, peak) in sorted(self.stages.items())],
+                'counters': [{'name': name, 'company': company, 'labels': dict(labels), 'value': value}
+                             for (name, company, labels), value in sorted(self.counters.items())],
+            }
+
+    def merge(self, snapshot: dict):
+        """Fold in a snapshot taken in another process (concurrent-mode parse workers)."""
+        with self._lock:
+            for s in snapshot['stages']:
+                entry = self.stages.setdefault((s['stage'], s['company']), [0, 0.0, 0.0])
+                entry[0] += s['count']
+                entry[1] += s['total_seconds']
+                entry[2] = max(entry[2], s['max_seconds'])
+            for c in snapshot['counters']:
+                key = (c['name'], c['company'], tuple(sorted(c['labels'].items())))
+                self.counters[key] = self.counters.get(key, 0) + c['value']
+
+    @staticmethod
+    def to_prometheus(snapshot: dict) -> str:
+        def labels(**kv):
+            escaped = {k: str(v).replace('\\', '\\\\').replace('"', '\\"') for k, v in kv.items()}
+            return '{' + ','.join(f'{k}="{v}"' for k, v in escaped.items()) + '}'
+
+        lines = [
+            '# HELP birthday_stage_duration_seconds Time spent per pipeline stage.',
+            '# TYPE birthday_stage_duration_seconds summary',
+        ]
+        for s in snapshot['stages']:
+            lbl = labels(stage=s['stage'], company=s['company'])
+            lines.append(f"birthday_stage_duration_seconds_sum{lbl} {s['total_seconds']}")
+            lines.append(f"birthday_stage_duration_seconds_count{lbl} {s['count']}")
+        lines += ['# HELP birthday_stage_duration_seconds_max Slowest single call per pipeline stage.',
+                  '# TYPE birthday_stage_duration_seconds_max gauge']
+        for s in snapshot['stages']:
+            lines.append(f"birthday_stage_duration_seconds_max{labels(stage=s['stage'], company=s['company'])} {s['max_seconds']}")
+
+        by_name: Dict[str, List[dict]] = {}
+        for c in snapshot['counters']:
+            by_name.setdefault(c['name'], []).append(c)
+        for name, entries in by_name.items():
+            lines.append(f"# TYPE birthday_{name}_total counter")
+            for c in entries:
+                lines.append(f"birthday_{name}_total{labels(company=c['company'], **c['labels'])} {c['value']}")
+
+        lines += ['# TYPE birthday_run_duration_seconds gauge',
+                  f"birthday_run_duration_seconds {snapshot['run_seconds']}",
+                  '# TYPE birthday_last_run_timestamp_seconds gauge',
+                  f"birthday_last_run_timestamp_seconds {snapshot['finished']}"]
+        return '\n'.join(lines) + '\n'
+
+    def export(self, json_path: str = '', prom_path: str = ''):
+        finished = time.time()
+        snapshot = dict(self.snapshot(), started=round(self.started, 3), finished=round(finished, 3),
+                        run_seconds=round(finished - self.started, 3))
+        if json_path:
+            _write_atomic(json_path, json.dumps(snapshot, indent=2))
+        if prom_path:
+            _write_atomic(prom_path, self.to_prometheus(snapshot))
+
 
 class BirthdayEmailSystem:
     def __init__(self):
         self.setup_logging()
         self.load_configuration()
 
-        # ------------ COMPANY IMAGE PATHS (EDIT THESE) -------------------
-        self.company_images = {
-            'Company1': r"C:\path\to\your\assets\Company1BdayCard.jpg",
-            'Company2': r"C:\path\to\your\assets\Company2BdayCard.jpg",
-            'Company3': r"C:\path\to\your\assets\Company3BdayCard.jpg",
-            'Company4': r"C:\path\to\your\assets\Company4BdayCard.jpg",
-            'Company': ""  # fallback (optional)
-        }
-
-        # ------------ COMPANY WEBSITE LINE (OPTIONAL) --------------------
-        self.company_sites = {
-            'Company1': "WWW.Company1.com",
-            'Company2': "WWW.Company2.com",
-            'Company3': "WWW.Company3.com",
-            'Company4': "WWW.Company4.com",
-            'Company': ""
-        }
+    def __getstate__(self):
+        # Pickled into parse worker processes: leave thread primitives behind
+        state = self.__dict__.copy()
+        state.pop('send_log', None)
+        state.pop('send_ledger', None)
+        state.pop('shard_store', None)
+        state.pop('_template_lock', None)
+        state.pop('metrics', None)
+        state.pop('_warm_lock', None)
+        state.pop('_person_log_seq', None)
+        state.pop('_rate_lock', None)
+        state['_rate_controllers'] = {}
+        state['recipient_index'] = None
+        state['_templates'] = {}
+        state['_warm_sessions'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.send_log = None  # parse workers never log or record sends
+        self.send_ledger = None
+        self.shard_store = None
+        self._template_lock = threading.Lock()
+        self.metrics = RunMetrics()  # sent back to the parent via _load_company_data_in_worker
+        self._warm_lock = threading.Lock()
+        self._person_log_seq = itertools.count()
+        self._rate_lock = threading.Lock()
 
     def setup_logging(self):
-        log_file = Path("birthday_emails.log")
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[logging.FileHandler(log_file, mode='a', encoding='utf-8'),
-                      logging.StreamHandler(sys.stdout)]
-        )
+        if not logging.getLogger().handlers:
+            concurrent = os.getenv('RUN_MODE', 'serial').lower() == 'concurrent'
+            handlers = _log_handlers(CONCURRENT_LOG_FORMAT if concurrent else LOG_FORMAT)
+            if os.getenv('LOG_ASYNC', 'false').lower() == 'true':
+                handlers = [_start_log_listener(handlers)]
+            logging.basicConfig(
+                level=getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO),
+                handlers=handlers
+            )
         self.logger = logging.getLogger(__name__)
         self.logger.info("")
         self.logger.info("")
@@ -78,35 +1145,268 @@ class BirthdayEmailSystem:
             'fallback_team_name_template': os.getenv('TEAM_NAME_TEMPLATE', '{company} HR Team'),
             'fallback_subject_template': os.getenv('SUBJECT_TEMPLATE', '🎉 Happy Birthday, {first_name}! - {company} Team'),
             'fallback_email_reputation_domain': os.getenv('EMAIL_REPUTATION_DOMAIN', ''),
+            # Parsed-workbook cache (normalized + validated frames, keyed by workbook version)
+            'cache_enabled': os.getenv('CACHE_ENABLED', 'true').lower() == 'true',
+            'cache_dir': os.getenv('CACHE_DIR', '.birthday_cache'),
+            'cache_max_entries': int(os.getenv('CACHE_MAX_ENTRIES', 16)),
+            # Scan only Confidential/DOB first and skip the rest of the workbook when nobody has a birthday
+            'lazy_load': os.getenv('LAZY_LOAD', 'true').lower() == 'true',
+            # Feb 29 birthdays in non-leap years: 'FEB28', 'MAR1' or 'SKIP'
+            'feb29_rule': os.getenv('FEB29_RULE', 'FEB28').upper(),
+            # 'serial' (one company after another) or 'concurrent' (parse in processes, send per company in threads)
+            'run_mode': os.getenv('RUN_MODE', 'serial').lower(),
+            'parse_workers': int(os.getenv('PARSE_WORKERS', 4)),
+            'send_workers': int(os.getenv('SEND_WORKERS', 4)),
+            # 'serial' (one connection, fixed delay) or 'async' (connection pool + token bucket)
+            'send_engine': os.getenv('SEND_ENGINE', 'serial').lower(),
+            'smtp_pool_size': os.getenv('SMTP_POOL_SIZE', '3'),
+            'send_rate': os.getenv('SEND_RATE', '2'),
+            'send_burst': os.getenv('SEND_BURST', '5'),
+            # 'fixed' (DELAY_BETWEEN_SENDS / SEND_RATE) or 'adaptive' (AIMD per SMTP relay, learned across runs)
+            'rate_control': os.getenv('RATE_CONTROL', 'fixed').lower(),
+            'send_rate_min': os.getenv('SEND_RATE_MIN', '0.2'),
+            'send_rate_max': os.getenv('SEND_RATE_MAX', '10'),
+            'rate_increase': float(os.getenv('RATE_INCREASE', 0.2)),
+            'rate_backoff': float(os.getenv('RATE_BACKOFF', 0.5)),
+            'rate_latency_target': float(os.getenv('RATE_LATENCY_TARGET', 2.0)),
+            'rate_state_file': os.getenv('RATE_STATE_FILE', 'birthday_rate_state.json'),
+            # Recovery from dropped connections and 4xx replies
+            'smtp_reconnect_attempts': int(os.getenv('SMTP_RECONNECT_ATTEMPTS', 5)),
+            'smtp_reconnect_backoff': float(os.getenv('SMTP_RECONNECT_BACKOFF', 1.0)),
+            'smtp_max_retries': int(os.getenv('SMTP_MAX_RETRIES', 3)),
+            'smtp_retry_queue_size': int(os.getenv('SMTP_RETRY_QUEUE_SIZE', 1000)),
+            'smtp_retry_delay': float(os.getenv('SMTP_RETRY_DELAY', 5.0)),
+            # Optional directory with per-company body templates (<Company>.txt / <Company>.html)
+            'template_dir': os.getenv('TEMPLATE_DIR', ''),
+            # Birthday card: 'inline' (shown in the HTML via multipart/related) or 'attachment'
+            'card_mode': os.getenv('CARD_MODE', 'inline').lower(),
+            # Size-capped, recompressed card variants (needs Pillow), cached by content hash
+            'card_optimize': os.getenv('CARD_OPTIMIZE', 'true').lower() == 'true',
+            'card_max_width': int(os.getenv('CARD_MAX_WIDTH', 800)),
+            'card_max_bytes': int(float(os.getenv('CARD_MAX_KB', 300)) * 1024),
+            'card_quality': int(os.getenv('CARD_QUALITY', 85)),
+            'card_cache_dir': os.getenv('CARD_CACHE_DIR') or os.path.join(os.getenv('CACHE_DIR', '.birthday_cache'), 'cards'),
+            # Run metrics written at the end of every run (opt-in; empty path = not written)
+            'metrics_json_file': os.getenv('METRICS_JSON_FILE', ''),
+            'metrics_prom_file': os.getenv('METRICS_PROM_FILE', ''),
+            # Catch-up ("since last successful run") bookkeeping
+            'run_state_file': os.getenv('RUN_STATE_FILE', 'birthday_run_state.json'),
+            'catch_up_max_days': int(os.getenv('CATCH_UP_MAX_DAYS', 7)),
+            # Daemon mode (--daemon)
+            'daemon_poll_interval': float(os.getenv('DAEMON_POLL_INTERVAL', 30)),
+            'daemon_retry_interval': float(os.getenv('DAEMON_RETRY_INTERVAL', 600)),
+            'smtp_warmup_minutes': float(os.getenv('SMTP_WARMUP_MINUTES', 5)),
+            # Company registry (JSON) and workbook discovery
+            'company_registry': os.getenv('COMPANY_REGISTRY', 'companies.json'),
+            'workbook_globs': self._parse_list(os.getenv('WORKBOOK_GLOB', '')),
+            # Two-stage outbox: compose every message into SPOOL_DIR first, then send the stored bytes
+            'spool_enabled': os.getenv('SPOOL_ENABLED', 'false').lower() == 'true',
+            'spool_dir': os.getenv('SPOOL_DIR', 'outbox'),
+            'compose_workers': int(os.getenv('COMPOSE_WORKERS', 4)),
+            'spool_stage': 'both',  # 'compose' with --compose-only (nothing is sent)
+            # Per-person INFO lines (sent / dry run): 'all', 'sample' (every Nth) or 'summary' (none)
+            'log_per_person': os.getenv('LOG_PER_PERSON', 'all').lower(),
+            'log_sample_every': max(1, int(os.getenv('LOG_SAMPLE_EVERY', 100))),
+            # One birthday email per person per run even when they are in several company workbooks
+            'dedup_across_companies': os.getenv('DEDUP_ACROSS_COMPANIES', 'false').lower() == 'true',
+            'dedup_key': os.getenv('DEDUP_KEY', 'email').lower(),  # 'email' or 'email_emp_id'
+            # 'registry' (registry order), 'first' (first file to get there) or a company list
+            'dedup_precedence': os.getenv('DEDUP_PRECEDENCE', 'registry'),
+            # Sharded sending: several workers split each file's recipients through leases in SHARD_STORE
+            'shard_enabled': os.getenv('SHARD_ENABLED', 'false').lower() == 'true',
+            'shard_store': os.getenv('SHARD_STORE', 'birthday_shards.sqlite3'),
+            'shard_count': max(1, int(os.getenv('SHARD_COUNT', 8))),
+            'shard_lease_seconds': float(os.getenv('SHARD_LEASE_SECONDS', 120)),
+            'shard_run_id': os.getenv('SHARD_RUN_ID', ''),
+            # --rerun: start a finished sharded run again (retry what the ledger does not show as sent)
+            'shard_rerun': False,
+            'shard_worker_id': os.getenv('SHARD_WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}",
         }
-
-        # Build per-company configs
-        self.company_configs: Dict[str, dict] = {
-            'Company1': self._build_company_config('COMPANY1', 'Company1'),
-            'Company2':  self._build_company_config('COMPANY2',  'Company2'),
-            'Company3': self._build_company_config('COMPANY3', 'Company3'),
-            'Company4':  self._build_company_config('COMPANY4',  'Company4'),
-            'Company': self._build_company_config('', 'Company')  # fallback
-        }
+        self._signature_memo: Dict[str, tuple] = {}
+        self.send_log = SendLogWriter(
+            os.getenv('SEND_LOG_DIR', 'C:/logs'),
+            flush_interval=float(os.getenv('SEND_LOG_FLUSH_INTERVAL', 2.0)),
+            batch_size=int(os.getenv('SEND_LOG_BATCH_SIZE', 100)),
+            logger=self.logger,
+        )
+        # Resume ledger: successful sends are recorded so a rerun never greets anyone twice
+        self.send_ledger = None
+        if os.getenv('LEDGER_ENABLED', 'true').lower() == 'true':
+            self.send_ledger = SendLedger(os.getenv('SEND_LEDGER_PATH', 'birthday_send_ledger.sqlite3'),
+                                          journal_mode='DELETE' if self.config['shard_enabled'] else 'WAL')
+        self.shard_store = None
+        if self.config['shard_enabled']:
+            self.shard_store = ShardLeaseStore(self.config['shard_store'], self.config['shard_lease_seconds'])
+        self._templates: Dict[str, CompanyTemplate] = {}
+        self._template_lock = threading.Lock()
+        self.metrics = RunMetrics()
+        # Pre-opened SMTP sessions per company (daemon warm-up), handed out by _open_smtp
+        self._warm_sessions: Dict[str, list] = {}
+        self._warm_lock = threading.Lock()
+        self._person_log_seq = itertools.count()
+        self.recipient_index: Optional[RecipientIndex] = None  # set by run() when deduplicating
+        # RATE_CONTROL=adaptive: one controller per SMTP relay (host:port), seeded from RATE_STATE_FILE
+        self._rate_controllers: Dict[str, AdaptiveRateController] = {}
+        self._rate_lock = threading.Lock()
+
+        # Build per-company configs, images, sites and filename tokens from the registry
+        self.registry = self.load_company_registry()
+        self._register_companies(self.registry)
 
         self.logger.info(f"Configuration loaded. Dry run: {self.config['dry_run']}")
         self.logger.info(f"P_Status filter: {self.config['p_status_filter']}")
+        self.logger.info(f"Run mode: {self.config['run_mode']}")
+        if self.config['log_per_person'] not in ('all', 'sample', 'summary'):
+            self.logger.warning(f"Invalid LOG_PER_PERSON value: {self.config['log_per_person']}. Using all.")
+            self.config['log_per_person'] = 'all'
+        if self.config['template_dir']:
+            for path in sorted(Path(self.config['template_dir']).glob('*.*')):
+                if path.suffix not in ('.txt', '.html'):
+                    continue
+                try:
+                    strict, problems = _template_problems(path.read_text(encoding='utf-8'))
+                except (OSError, UnicodeDecodeError) as e:
+                    strict, problems = True, [str(e)]
+                if problems and strict:
+                    self.logger.error(f"Template {path}: {', '.join(problems)}; emails using it will fail")
+                elif problems:
+                    self.logger.warning(f"Template {path}: {', '.join(problems)} left as written")
+        if self.config['card_mode'] not in ('inline', 'attachment'):
+            self.logger.warning(f"Invalid CARD_MODE value: {self.config['card_mode']}. Using inline.")
+            self.config['card_mode'] = 'inline'
+        if not 1 <= self.config['card_quality'] <= 95:
+            quality = max(1, min(self.config['card_quality'], 95))
+            self.logger.warning(f"CARD_QUALITY must be between 1 and 95, got {self.config['card_quality']}. Using {quality}.")
+            self.config['card_quality'] = quality
+        if self.config['rate_control'] not in ('fixed', 'adaptive'):
+            self.logger.warning(f"Invalid RATE_CONTROL value: {self.config['rate_control']}. Using fixed.")
+            self.config['rate_control'] = 'fixed'
+        if self.config['shard_enabled']:
+            self.logger.info(f"Sharded sending as worker {self.config['shard_worker_id']}: "
+                             f"{self.config['shard_count']} shards per file, store {self.config['shard_store']}")
+        if self.config['dedup_key'] not in ('email', 'email_emp_id'):
+            self.logger.warning(f"Invalid DEDUP_KEY value: {self.config['dedup_key']}. Using email.")
+            self.config['dedup_key'] = 'email'
+        if self.config['dedup_across_companies']:
+            self.logger.info(f"Cross-company dedup: key={self.config['dedup_key']} "
+                             f"precedence={self.config['dedup_precedence']}")
+            if self.config['dedup_precedence'].lower() not in ('registry', 'first'):
+                for name in self._parse_list(self.config['dedup_precedence']):
+                    if name not in self.company_configs:
+                        self.logger.warning(f"DEDUP_PRECEDENCE names unknown company {name!r}")
+        if self.config['feb29_rule'] not in ('FEB28', 'MAR1', 'SKIP'):
+            self.logger.warning(f"Invalid FEB29_RULE value: {self.config['feb29_rule']}. Using FEB28.")
+            self.config['feb29_rule'] = 'FEB28'
         for name, cfg in self.company_configs.items():
             masked_user = (cfg.get('smtp_user') or '')[:1] + '***' if cfg.get('smtp_user') else '(not set)'
             self.logger.info(f"Company cfg [{name}] host={cfg.get('smtp_host','')} port={cfg.get('smtp_port','')} user={masked_user} rep_domain={cfg.get('email_reputation_domain','')}")
+            if cfg['error'] and name != 'Company':
+                self.logger.warning(f"Company cfg [{name}] is incomplete and its files will be skipped: {cfg['error']}")
+
+    def load_company_registry(self) -> dict:
+        """
+        Read the company registry (COMPANY_REGISTRY, default companies.json). Without that file the
+        built-in Company1-Company4 registry is used.
+        """
+        path = Path(self.config['company_registry'])
+        if not path.is_file():
+            self.logger.info(f"No company registry at {path}; using the built-in Company1-Company4 registry")
+            return DEFAULT_COMPANY_REGISTRY
+        registry = json.loads(path.read_text(encoding='utf-8'))
+        if not isinstance(registry.get('companies'), list):
+            raise ValueError(f"Company registry {path} needs a 'companies' list")
+        self.logger.info(f"Loaded {len(registry['companies'])} companies from registry {path}")
+        return registry
+
+    @staticmethod
+    def _token_key(text: str) -> str:
+        """Upper-case words of `text` joined by '_' (the form filename tokens are looked up in)."""
+        return '_'.join(word for word in _TOKEN_SPLIT_RE.split(text.upper()) if word)
+
+    def _register_companies(self, registry: dict):
+        """
+        Build company_configs, company_images, company_sites and the filename-token lookup from the
+        registry, and validate every config once. 'Company' is the generic fallback (global env).
+        """
+        self.company_configs: Dict[str, dict] = {}
+        self.company_images: Dict[str, str] = {}
+        self.company_sites: Dict[str, str] = {}
+        self._company_tokens: Dict[str, str] = {}
+        self._max_token_words = 1
+
+        for entry in registry['companies']:
+            name = entry.get('name')
+            if not name or name == 'Company' or name in self.company_configs:
+                raise ValueError(f"Company registry: missing, reserved or duplicate company name {name!r}")
+            prefix = entry.get('env_prefix') or self._token_key(name)
+            self.company_configs[name] = self._build_company_config(prefix, name, entry.get('settings'))
+            self.company_images[name] = entry.get('image', '')
+            self.company_sites[name] = entry.get('site', '')
+            for token in entry.get('tokens') or [prefix]:
+                key = self._token_key(token)
+                if self._company_tokens.get(key, name) != name:
+                    raise ValueError(f"Company registry: token {token!r} is used by both "
+                                     f"{self._company_tokens[key]} and {name}")
+                self._company_tokens[key] = name
+                self._max_token_words = max(self._max_token_words, key.count('_') + 1)
+
+        fallback = registry.get('fallback', {})
+        self.company_configs['Company'] = self._build_company_config('', 'Company', fallback.get('settings'))
+        self.company_images['Company'] = fallback.get('image', '')
+        self.company_sites['Company'] = fallback.get('site', '')
+
+    def _validate_company_config(self, cfg: dict):
+        """
+        Check a company config once at startup. SMTP problems go to cfg['error'] (the company cannot
+        send); a bad SEND_TIME/TIMEZONE goes to cfg['schedule_error'] (only daemon mode cares).
+        """
+        missing = [k for k in ('smtp_host', 'smtp_port', 'smtp_user', 'smtp_pass') if not cfg.get(k)]
+        cfg['error'] = f"Missing SMTP settings for {cfg['company']}: {', '.join(missing)}" if missing else ''
+        cfg['send_at'], cfg['schedule_error'] = None, ''
+        try:
+            hour, minute = (int(part) for part in cfg['send_time'].split(':'))
+            if not (0 <= hour < 24 and 0 <= minute < 60):
+                raise ValueError("out of range")
+            tz = None
+            if cfg['timezone']:
+                if ZoneInfo is None:
+                    raise ValueError("TIMEZONE needs Python 3.9+ (zoneinfo)")
+                tz = ZoneInfo(cfg['timezone'])
+            cfg['send_at'] = (hour, minute, tz)
+        except Exception as e:
+            cfg['schedule_error'] = f"Invalid SEND_TIME/TIMEZONE for {cfg['company']} ({cfg['send_time']!r}, {cfg['timezone']!r}): {e}"
+
+    def discover_workbooks(self, patterns: Optional[List[str]] = None) -> List[str]:
+        """
+        Expand workbook glob patterns (default: WORKBOOK_GLOB, else the registry's workbook_globs)
+        into a sorted list of data sources (workbooks, SQLite files, CSV/Parquet directories),
+        skipping Excel lock files (~$...).
+        """
+        patterns = patterns or self.config['workbook_globs'] or self.registry.get('workbook_globs', [])
+        files = sorted({path for pattern in patterns for path in glob.glob(pattern)
+                        if not Path(path).name.startswith('~$')
+                        and any(source_cls.handles(Path(path)) for source_cls in DATA_SOURCES)})
+        self.logger.info(f"Discovered {len(files)} workbook(s) from {len(patterns)} pattern(s)")
+        return files
 
     def _parse_list(self, raw: str) -> List[str]:
         return [e.strip() for e in raw.split(',') if e.strip()]
 
-    def _build_company_config(self, prefix: str, company_label: str) -> dict:
+    def _build_company_config(self, prefix: str, company_label: str, settings: Optional[dict] = None) -> dict:
         """
         Build a single company config with overrides. If prefix == '', we use global SMTP_* as fallback.
+        Precedence: <PREFIX>_<KEY> env var, then the registry entry's settings, then the global default.
         """
+        settings = settings or {}
+
         def gv(key: str, default: str = '') -> str:
-            if prefix:
-                return os.getenv(f'{prefix}_{key}', default)
-            # fallback to non-prefixed env (global)
-            return os.getenv(key, default)
+            # prefix == '': fallback to non-prefixed env (global)
+            value = os.getenv(f'{prefix}_{key}' if prefix else key)
+            if value is not None:
+                return value
+            if key in settings:
+                return str(settings[key])
+            return default
 
         cfg = {
             'company': company_label,
@@ -118,92 +1418,174 @@ class BirthdayEmailSystem:
             'email_bcc': self._parse_list(gv('EMAIL_BCC', os.getenv('EMAIL_BCC', ''))),
             'team_name_template': gv('TEAM_NAME_TEMPLATE', self.config['fallback_team_name_template']),
             'subject_template': gv('SUBJECT_TEMPLATE', self.config['fallback_subject_template']),
-            'email_reputation_domain': gv('EMAIL_REPUTATION_DOMAIN', self.config['fallback_email_reputation_domain'] or (company_label.lower() + '.com')),
+            'email_reputation_domain': gv('EMAIL_REPUTATION_DOMAIN', self.config['fallback_email_reputation_domain'] or (self._token_key(company_label).lower().replace('_', '-') + '.com')),
             'use_authentication': True,
+            # async engine: connections per company, token-bucket rate (msgs/sec) and burst
+            'smtp_pool_size': int(gv('SMTP_POOL_SIZE', self.config['smtp_pool_size'])),
+            'send_rate': float(gv('SEND_RATE', self.config['send_rate'])),
+            'send_burst': float(gv('SEND_BURST', self.config['send_burst'])),
+            # RATE_CONTROL=adaptive: bounds (msgs/sec) for the learned per-relay rate
+            'send_rate_min': float(gv('SEND_RATE_MIN', self.config['send_rate_min'])),
+            'send_rate_max': float(gv('SEND_RATE_MAX', self.config['send_rate_max'])),
+            # daemon mode: local send time (HH:MM) in the company's IANA time zone (empty = server time)
+            'send_time': gv('SEND_TIME', os.getenv('SEND_TIME', '09:00')),
+            'timezone': gv('TIMEZONE', os.getenv('TIMEZONE', '')),
+            # 'per_message' (CC/BCC on every email) or 'digest' (one summary per batch to CC/BCC)
+            'cc_mode': gv('CC_MODE', os.getenv('CC_MODE', 'per_message')).lower(),
         }
+        if cfg['cc_mode'] not in ('per_message', 'digest'):
+            self.logger.warning(f"Invalid CC_MODE value for {company_label}: {cfg['cc_mode']}. Using per_message.")
+            cfg['cc_mode'] = 'per_message'
+        if not 0 < cfg['send_rate_min'] <= cfg['send_rate_max']:
+            self.logger.warning(f"Invalid SEND_RATE_MIN/SEND_RATE_MAX for {company_label}: "
+                                f"{cfg['send_rate_min']}/{cfg['send_rate_max']}. Using 0.2/10.")
+            cfg['send_rate_min'], cfg['send_rate_max'] = 0.2, 10.0
         cfg['connection_security'] = 'SSL' if cfg['smtp_port'] == 465 else 'STARTTLS'
+        self._validate_company_config(cfg)
         return cfg
 
     def get_company_config(self, company: str) -> dict:
-        """Return the config for the detected company, else fallback to 'Company'."""
+        """Return the config for the detected company, else fallback to 'Company' (validated at startup)."""
         cfg = self.company_configs.get(company) or self.company_configs['Company']
-        # Validate minimal SMTP fields
-        missing = [k for k in ('smtp_host', 'smtp_port', 'smtp_user', 'smtp_pass') if not cfg.get(k)]
-        if missing:
-            raise ValueError(f"Missing SMTP settings for {company}: {', '.join(missing)}")
+        if cfg['error']:
+            raise ValueError(cfg['error'])
         return cfg
 
     # --- Data loading & normalization -----------------------------------
 
     def detect_company_from_path(self, file_path: str) -> str:
         """
-        Detect company name from Excel filename (case-insensitive).
-        Handles: Company1, Company2, Company3, Company4
+        Detect company name from Excel filename (case-insensitive) via the registry's tokens.
         """
-        name = Path(file_path).name.upper()
-        mapping = {
-            'COMPANY1': 'Company1',
-            'COMPANY2': 'Company2',
-            'COMPANY3': 'Company3',
-            'COMPANY4': 'Company4',
-        }
-        for token, proper in mapping.items():
-            if token in name:
-                self.logger.info(f"Detected company name from filename: {proper}")
-                return proper
-        self.logger.info("No known company token detected in filename; defaulting to generic 'Company'")
+        company = self._company_for_path(file_path)
+        if company == 'Company':
+            self.logger.info("No known company token detected in filename; defaulting to generic 'Company'")
+        else:
+            self.logger.info(f"Detected company name from filename: {company}")
+        return company
+
+    def _company_for_path(self, file_path: str) -> str:
+        """
+        Split the filename into words on non-alphanumerics and look each word (and each run of up to
+        the longest token's word count) up in the token dict, so cost does not grow with the number
+        of companies. 'COMPANY1_MASTER_EXCEL_HR_2025.xlsx' matches token 'COMPANY1'.
+        """
+        words = [word for word in _TOKEN_SPLIT_RE.split(Path(file_path).stem.upper()) if word]
+        for size in range(1, self._max_token_words + 1):
+            for start in range(len(words) - size + 1):
+                company = self._company_tokens.get('_'.join(words[start:start + size]))
+                if company:
+                    return company
         return 'Company'
 
     def normalize_column_names(self, df: pd.DataFrame) -> pd.DataFrame:
         df.columns = df.columns.str.strip()
         mapping = {}
         for col in df.columns:
-            lc = col.lower().replace('_', '').strip()
-            if ('emp' in lc) and ('id' in lc):
-                mapping[col] = 'Emp_Id'
-            elif 'firstname' in lc or ('first' in lc and 'name' in lc):
-                mapping[col] = 'First_Name'
-            elif 'lastname' in lc or ('last' in lc and 'name' in lc):
-                mapping[col] = 'Last_Name'
-            elif col.strip().upper() == 'DOB':
-                mapping[col] = 'DOB'
-            elif col.strip() == 'P_Email1':
-                mapping[col] = 'P_Email1'
-            elif 'pstatus' in lc or 'p_status' in col.lower():
-                mapping[col] = 'P_Status'
+            canonical = self._canonical_column_name(col)
+            if canonical:
+                mapping[col] = canonical
         return df.rename(columns=mapping)
 
+    def _canonical_column_name(self, col: str) -> Optional[str]:
+        """Return the pipeline's name for a sheet header, or None if the column is not used."""
+        lc = col.lower().replace('_', '').strip()
+        if ('emp' in lc) and ('id' in lc):
+            return 'Emp_Id'
+        elif 'firstname' in lc or ('first' in lc and 'name' in lc):
+            return 'First_Name'
+        elif 'lastname' in lc or ('last' in lc and 'name' in lc):
+            return 'Last_Name'
+        elif col.strip().upper() == 'DOB':
+            return 'DOB'
+        elif col.strip() == 'P_Email1':
+            return 'P_Email1'
+        elif 'pstatus' in lc or 'p_status' in col.lower():
+            return 'P_Status'
+        return None
+
     def load_and_validate_data(self, excel_path: str) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-        """Load Confidential, Contact Details, Employee Status."""
+        """Load Confidential, Contact Details, Employee Status (from the parsed-workbook cache when unchanged)."""
         try:
-            confidential_df = pd.read_excel(excel_path, sheet_name='Confidential')
-            contact_df = pd.read_excel(excel_path, sheet_name='Contact Details')
-            status_df = pd.read_excel(excel_path, sheet_name='Employee Status')
+            signature = self._workbook_signature(excel_path) if self.config['cache_enabled'] else None
+            frames = self._read_cached_frames(signature) if signature else None
+            if frames is None:
+                frames = self._parse_workbook(excel_path)
+                if signature:
+                    self._write_cached_frames(signature, frames)
+            else:
+                self.logger.info(f"Using cached parsed data for {Path(excel_path).name}")
 
-            confidential_df = self.normalize_column_names(confidential_df)
-            contact_df = self.normalize_column_names(contact_df)
-            status_df = self.normalize_column_names(status_df)
+            confidential_df, contact_df, status_df = frames
 
-            req_conf = ['Emp_Id', 'First_Name', 'Last_Name', 'DOB']
-            req_contact = ['Emp_Id', 'First_Name', 'Last_Name', 'P_Email1']
-            req_status = ['Emp_Id', 'First_Name', 'Last_Name', 'P_Status']
+            self.logger.info(f"Loaded {len(confidential_df)} records from Confidential sheet")
+            self.logger.info(f"Loaded {len(contact_df)} records from Contact Details sheet")
+            self.logger.info(f"Loaded {len(status_df)} records from Employee Status sheet")
+
+            return confidential_df, contact_df, status_df
+
+        except Exception as e:
+            self.logger.error(f"Error loading data from {excel_path}: {str(e)}")
+            raise
 
-            for col in req_conf:
-                if col not in confidential_df.columns:
+    def data_source(self, path: str) -> DataSource:
+        """The DataSource for a workbook, CSV/Parquet directory or SQLite file (see DATA_SOURCES)."""
+        return open_data_source(path, self._canonical_column_name)
+
+    def _parse_workbook(self, excel_path: str) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """Read the three tables (column names normalized by the source), check required columns and parse DOB."""
+        tables = self.data_source(excel_path).read(DataSource.TABLES)
+        return self._validate_frames(tables['Confidential'], tables['Contact Details'], tables['Employee Status'])
+
+    def _validate_frames(self, confidential_df: pd.DataFrame, contact_df: pd.DataFrame,
+                         status_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """Check required columns on normalized sheets and parse DOB."""
+        req_conf = ['Emp_Id', 'First_Name', 'Last_Name', 'DOB']
+        req_contact = ['Emp_Id', 'First_Name', 'Last_Name', 'P_Email1']
+        req_status = ['Emp_Id', 'First_Name', 'Last_Name', 'P_Status']
+
+        for col in req_conf:
+            if col not in confidential_df.columns:
+                raise ValueError(f"Required column '{col}' not found in Confidential")
+        for col in req_contact:
+            if col not in contact_df.columns:
+                raise ValueError(f"Required column '{col}' not found in Contact Details")
+        for col in req_status:
+            if col not in status_df.columns:
+                raise ValueError(f"Required column '{col}' not found in Employee Status")
+
+        confidential_df['DOB_Parsed'] = pd.to_datetime(confidential_df['DOB'], errors='coerce')
+        confidential_df = confidential_df[confidential_df['DOB_Parsed'].notna()]
+
+        return confidential_df, contact_df, status_df
+
+    def load_todays_birthday_data(self, excel_path: str, dates: Optional[List[date]] = None):
+        """
+        Lazy load when the cache is disabled: read only Emp_Id/DOB from Confidential and return
+        None when nobody has a birthday on any of `dates` (default: today). Otherwise load the three
+        tables restricted to the matching Emp_Ids and validate them exactly like
+        load_and_validate_data.
+        """
+        try:
+            source = self.data_source(excel_path)
+            dob_df = source.read(('Confidential',), columns=['Emp_Id', 'DOB'])['Confidential']
+            for col in ('Emp_Id', 'DOB'):
+                if col not in dob_df.columns:
                     raise ValueError(f"Required column '{col}' not found in Confidential")
-            for col in req_contact:
-                if col not in contact_df.columns:
-                    raise ValueError(f"Required column '{col}' not found in Contact Details")
-            for col in req_status:
-                if col not in status_df.columns:
-                    raise ValueError(f"Required column '{col}' not found in Employee Status")
 
-            confidential_df['DOB_Parsed'] = pd.to_datetime(confidential_df['DOB'], errors='coerce')
-            confidential_df = confidential_df[confidential_df['DOB_Parsed'].notna()]
+            dob = pd.to_datetime(dob_df['DOB'], errors='coerce')
+            emp_ids = set(dob_df.loc[self._birthday_mask(dob, dates), 'Emp_Id'])
+            self.logger.info(f"Birthday precheck for {Path(excel_path).name}: {len(emp_ids)} match(es) in {len(dob_df)} rows")
+            if not emp_ids:
+                return None
 
-            self.logger.info(f"Loaded {len(confidential_df)} records from Confidential sheet")
-            self.logger.info(f"Loaded {len(contact_df)} records from Contact Details sheet")
-            self.logger.info(f"Loaded {len(status_df)} records from Employee Status sheet")
+            tables = source.read(DataSource.TABLES, emp_ids=emp_ids)
+            confidential_df, contact_df, status_df = self._validate_frames(
+                tables['Confidential'], tables['Contact Details'], tables['Employee Status'])
+
+            self.logger.info(f"Loaded {len(confidential_df)} records from Confidential sheet (birthday Emp_Ids only)")
+            self.logger.info(f"Loaded {len(contact_df)} records from Contact Details sheet (birthday Emp_Ids only)")
+            self.logger.info(f"Loaded {len(status_df)} records from Employee Status sheet (birthday Emp_Ids only)")
 
             return confidential_df, contact_df, status_df
 
@@ -211,149 +1593,545 @@ class BirthdayEmailSystem:
             self.logger.error(f"Error loading data from {excel_path}: {str(e)}")
             raise
 
-    def filter_todays_birthdays(self, confidential_df: pd.DataFrame, status_df: pd.DataFrame) -> pd.DataFrame:
+    # --- Parsed-workbook cache ------------------------------------------------
+
+    def _source_stamp(self, excel_path: str) -> Tuple[Tuple[str, int, int], ...]:
+        """(name, size, mtime) of every file making up a data source: changes whenever any of them does."""
+        return tuple((f.name, st.st_size, st.st_mtime_ns)
+                     for f in self.data_source(excel_path).files() for st in [f.stat()])
+
+    def _workbook_signature(self, excel_path: str) -> Tuple[str, str]:
+        """
+        Return (path_key, version_key) for a data source. The version key covers size, mtime
+        and a SHA-256 of the content of each of its files, so any edit yields a new cache entry.
+        """
+        path = Path(excel_path).resolve()
+        stamp = self._source_stamp(str(path))
+        memo = self._signature_memo.get(str(path))
+        if memo and memo[0] == stamp:
+            return memo[1]
+
+        content = hashlib.sha256()
+        for file in self.data_source(str(path)).files():
+            with open(file, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    content.update(chunk)
+        path_key = hashlib.sha1(str(path).lower().encode('utf-8')).hexdigest()[:16]
+        if len(stamp) == 1:
+            size_mtime = f"{stamp[0][1]}:{stamp[0][2]}"  # single file: same key as before sources were added
+        else:
+            size_mtime = ';'.join(f"{name}:{size}:{mtime}" for name, size, mtime in stamp)
+        version_key = hashlib.sha256(f"{size_mtime}:{content.hexdigest()}".encode('utf-8')).hexdigest()[:24]
+        self._signature_memo[str(path)] = (stamp, (path_key, version_key))
+        return path_key, version_key
+
+    def _cache_entry_path(self, signature: Tuple[str, str]) -> Path:
+        path_key, version_key = signature
+        return Path(self.config['cache_dir']) / f"{path_key}-{version_key}"
+
+    def _ensure_cache_dir(self) -> Path:
+        """Create CACHE_DIR readable by the owner only: its entries hold the HR tables (DOB, personal email)."""
+        cache_dir = Path(self.config['cache_dir'])
+        cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        try:
+            os.chmod(cache_dir, 0o700)
+        except OSError:
+            pass
+        return cache_dir
+
+    def _read_cached_frames(self, signature: Tuple[str, str]):
+        """Return the cached (confidential, contact, status) frames, or None on a miss."""
+        entry = self._cache_entry_path(signature)
+        manifest_path = entry / CACHE_MANIFEST
+        if not manifest_path.exists():
+            return None
+        try:
+            manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+            frames = tuple(self._read_cache_table(entry, name, manifest['tables'][name]) for name in CACHE_TABLES)
+            os.utime(entry)  # mark as recently used for LRU eviction
+            return frames
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable cache entry {entry.name}: {e}")
+            return None
+
+    def _write_cached_frames(self, signature: Tuple[str, str], frames) -> None:
+        """Store parsed frames, drop stale versions of the same workbook and enforce the entry limit."""
+        entry = self._cache_entry_path(signature)
+        tmp = entry.with_name(f".{entry.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self._ensure_cache_dir()
+            tmp.mkdir(mode=0o700)
+            tables = {name: self._write_cache_table(tmp, name, frame) for name, frame in zip(CACHE_TABLES, frames)}
+            (tmp / CACHE_MANIFEST).write_text(json.dumps({'tables': tables}), encoding='utf-8')
+            try:
+                os.replace(tmp, entry)
+            except OSError:
+                if not (entry / CACHE_MANIFEST).exists():  # else another worker stored it first
+                    raise
+            self._evict_cache(signature)
+        except Exception as e:
+            self.logger.warning(f"Could not write cache entry {entry.name}: {e}")
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    @staticmethod
+    def _write_cache_table(entry: Path, name: str, df: pd.DataFrame) -> dict:
+        """
+        Write one table without pickle: parquet when pyarrow is installed, else CSV. The returned
+        manifest records every column's dtype (and the index) so the frame reads back unchanged.
+        """
+        meta = {'index_name': df.index.name, 'columns': [[str(col), str(dtype)] for col, dtype in df.dtypes.items()]}
+        if pyarrow is not None:
+            try:
+                df.to_parquet(entry / f"{name}.parquet")
+                return {**meta, 'format': 'parquet'}
+            except Exception:
+                pass  # e.g. an object column mixing numbers and text: fall back to CSV
+        out = pd.DataFrame({'__index__': [_encode_cache_cell(v) for v in df.index]}, index=range(len(df)))
+        for col in df.columns:
+            kind = _cache_column_kind(df[col].dtype)
+            values = df[col].to_numpy()
+            if kind == 'json':
+                out[col] = [_encode_cache_cell(v) for v in values]
+            elif kind == 'datetime':
+                out[col] = ['' if pd.isna(v) else pd.Timestamp(v).isoformat() for v in values]
+            else:
+                out[col] = ['' if pd.isna(v) else repr(v.item() if hasattr(v, 'item') else v) for v in values]
+        out.to_csv(entry / f"{name}.csv", index=False)
+        return {**meta, 'format': 'csv'}
+
+    @staticmethod
+    def _read_cache_table(entry: Path, name: str, meta: dict) -> pd.DataFrame:
+        if meta['format'] == 'parquet':
+            return pd.read_parquet(entry / f"{name}.parquet")
+        raw = pd.read_csv(entry / f"{name}.csv", dtype=str, keep_default_na=False, na_filter=False)
+        df = pd.DataFrame(index=pd.Index([_decode_cache_cell(v) for v in raw['__index__']], name=meta['index_name']))
+        for col, dtype in meta['columns']:
+            kind = _cache_column_kind(pd.api.types.pandas_dtype(dtype))
+            values = raw[col].tolist()
+            if kind == 'json':
+                column = pd.Series([_decode_cache_cell(v) for v in values], index=df.index, dtype=object)
+            elif kind == 'datetime':
+                column = pd.Series(pd.to_datetime([v or None for v in values]), index=df.index)
+            elif kind == 'bool':
+                column = pd.Series([None if v == '' else v == 'True' for v in values], index=df.index, dtype=object)
+            else:
+                column = pd.Series(pd.to_numeric([v or math.nan for v in values]), index=df.index)
+            df[col] = column if dtype == 'object' else column.astype(dtype)
+        return df
+
+    def _evict_cache(self, signature: Tuple[str, str]) -> None:
+        """Remove outdated versions of this workbook, then least-recently-used entries over the limit."""
+        cache_dir = Path(self.config['cache_dir'])
+        path_key, _ = signature
+        current = self._cache_entry_path(signature)
+        entries = []
+        for entry in cache_dir.iterdir():
+            if entry.suffix == '.pkl':
+                entry.unlink(missing_ok=True)  # pickle entries from older versions are never loaded
+                continue
+            if not entry.is_dir() or entry.name.startswith('.') or entry.name == 'cards':
+                continue
+            if entry != current and entry.name.startswith(f"{path_key}-"):
+                self._remove_cache_entry(entry)
+                continue
+            entries.append(entry)
+
+        excess = len(entries) - max(self.config['cache_max_entries'], 1)
+        if excess > 0:
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            for entry in entries[:excess]:
+                self._remove_cache_entry(entry)
+                self.logger.info(f"Evicted cache entry {entry.name}")
+
+    @staticmethod
+    def _remove_cache_entry(entry: Path) -> None:
+        shutil.rmtree(entry, ignore_errors=True)
+
+    # --- Birthday selection ---------------------------------------------------
+
+    def build_birthday_index(self, confidential_df: pd.DataFrame) -> Dict[Tuple[int, int], list]:
+        """Map (month, day) of DOB_Parsed to the row positions in confidential_df with that birthday."""
+        dob = confidential_df['DOB_Parsed']
+        groups = pd.Series(range(len(dob))).groupby([dob.dt.month.to_numpy(), dob.dt.day.to_numpy()])
+        return {(int(m), int(d)): positions.tolist() for (m, d), positions in groups.indices.items()}
+
+    def load_birthday_index(self, excel_path: str, confidential_df: pd.DataFrame) -> Dict[Tuple[int, int], list]:
+        """
+        Return the (month, day) index for a workbook. When the workbook's frames are cached, the
+        index is persisted next to the cache entry so it is built once per workbook version.
+        """
+        if not self.config['cache_enabled']:
+            return self.build_birthday_index(confidential_df)
+
+        entry = self._cache_entry_path(self._workbook_signature(excel_path))
+        index_path = entry / 'birthday_index.json'
+        if index_path.exists():
+            try:
+                stored = json.loads(index_path.read_text(encoding='utf-8'))
+                return {(month, day): positions for month, day, positions in stored}
+            except Exception as e:
+                self.logger.warning(f"Rebuilding unreadable birthday index in {entry.name}: {e}")
+
+        index = self.build_birthday_index(confidential_df)
+        if (entry / CACHE_MANIFEST).exists():
+            try:
+                tmp = index_path.with_name(f".birthday_index.{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp.write_text(json.dumps([[month, day, positions] for (month, day), positions in index.items()]),
+                               encoding='utf-8')
+                os.replace(tmp, index_path)
+            except Exception as e:
+                self.logger.warning(f"Could not write birthday index in {entry.name}: {e}")
+        return index
+
+    def _birthday_keys(self, dates: List[date]) -> Dict[Tuple[int, int], date]:
+        """
+        Map each (month, day) to look up to the date it is celebrated on. Feb 29 birthdays in
+        non-leap years land on Feb 28 or Mar 1 (or nowhere) according to FEB29_RULE.
+        """
+        keys = {}
+        rule = self.config['feb29_rule']
+        for d in dates:
+            keys[(d.month, d.day)] = d
+            if not isleap(d.year):
+                if (rule == 'FEB28' and (d.month, d.day) == (2, 28)) or \
+                        (rule == 'MAR1' and (d.month, d.day) == (3, 1)):
+                    keys[(2, 29)] = d
+        return keys
+
+    def _birthday_mask(self, dob: pd.Series, dates: Optional[List[date]] = None) -> pd.Series:
+        """Boolean mask of parsed DOBs whose birthday falls on one of `dates` (default: today)."""
+        keys = self._birthday_keys(dates or [date.today()])
+        codes = dob.dt.month * 100 + dob.dt.day
+        return codes.isin([m * 100 + d for m, d in keys])
+
+    @staticmethod
+    def _describe_dates(dates: List[date]) -> str:
+        if len(dates) == 1:
+            return dates[0].strftime('%Y-%m-%d')
+        return f"{min(dates).strftime('%Y-%m-%d')} to {max(dates).strftime('%Y-%m-%d')}"
+
+    def filter_todays_birthdays(self, confidential_df: pd.DataFrame, status_df: pd.DataFrame,
+                                index: Optional[Dict[Tuple[int, int], list]] = None) -> pd.DataFrame:
         """Filter for today's birthdays and apply P_Status filter."""
-        today = date.today()
-        mask = (
-            (confidential_df['DOB_Parsed'].dt.month == today.month) &
-            (confidential_df['DOB_Parsed'].dt.day == today.day)
-        )
-        df = confidential_df[mask].copy()
+        return self.filter_birthdays(confidential_df, status_df, [date.today()], index)
+
+    def filter_birthdays(self, confidential_df: pd.DataFrame, status_df: pd.DataFrame, dates: List[date],
+                         index: Optional[Dict[Tuple[int, int], list]] = None) -> pd.DataFrame:
+        """
+        Select birthdays falling on any of `dates` via the (month, day) index and apply the P_Status
+        filter. Adds a Birthday_Date column with the date each birthday is celebrated on.
+        """
+        if index is None:
+            index = self.build_birthday_index(confidential_df)
+        when = self._describe_dates(dates)
 
-        if df.empty:
-            self.logger.info(f"No birthdays on {today.strftime('%Y-%m-%d')}. Exiting.")
+        matches = []
+        for key, celebrated_on in self._birthday_keys(dates).items():
+            matches.extend((pos, celebrated_on) for pos in index.get(key, ()))
+        matches.sort()
+
+        if not matches:
+            self.logger.info(f"No birthdays on {when}. Exiting.")
             return pd.DataFrame()
 
-        df = df.merge(status_df[['Emp_Id', 'P_Status']], on='Emp_Id', how='left')
+        df = confidential_df.iloc[[pos for pos, _ in matches]].copy()
+        df['Birthday_Date'] = [celebrated_on for _, celebrated_on in matches]
 
+        # P_Status by Emp_Id (first row wins); the filter keeps anyone with a matching status row
         p = self.config['p_status_filter']
-        if p == 'A':
-            self.logger.info("Filtering for P_Status = 'A' (Active) only")
-            df = df[df['P_Status'] == 'A']
-        elif p == 'T':
-            self.logger.info("Filtering for P_Status = 'T' (Terminated) only")
-            df = df[df['P_Status'] == 'T']
-        elif p == 'BOTH':
+        if p not in ('A', 'T', 'BOTH'):
+            self.logger.warning(f"Invalid P_STATUS_FILTER value: {p}. Using A (Active only).")
+            p = 'A'
+        if p == 'BOTH':
             self.logger.info("Including all P_Status values (A, T, and others)")
+            first_status = status_df.drop_duplicates(subset=['Emp_Id']).set_index('Emp_Id')['P_Status']
+            df['P_Status'] = df['Emp_Id'].map(first_status)
         else:
-            self.logger.warning(f"Invalid P_STATUS_FILTER value: {p}. Using A (Active only).")
-            df = df[df['P_Status'] == 'A']
-
-        self.logger.info(f"Found {len(df)} birthdays on {today.strftime('%Y-%m-%d')}")
-        for _, person in df.iterrows():
-            self.logger.info(
-                f"Birthday Person: Emp_Id={person.get('Emp_Id','N/A')}, "
-                f"Name={person.get('First_Name','')} {person.get('Last_Name','')}, "
-                f"DOB={person.get('DOB','')}, P_Status={person.get('P_Status','')}"
-            )
+            label = 'Active' if p == 'A' else 'Terminated'
+            self.logger.info(f"Filtering for P_Status = '{p}' ({label}) only")
+            df = df[df['Emp_Id'].isin(status_df.loc[status_df['P_Status'] == p, 'Emp_Id'])]
+            df['P_Status'] = p
+
+        self.logger.info(f"Found {len(df)} birthdays on {when}")
+        self._log_people(logging.DEBUG, "Birthday people:", df, ['Emp_Id', 'First_Name', 'Last_Name', 'DOB', 'P_Status'])
         return df
 
     def join_email_data(self, birthdays_df: pd.DataFrame, contact_df: pd.DataFrame) -> pd.DataFrame:
-        """Join with contacts and validate/deduplicate emails."""
+        """
+        Join with contacts and validate/deduplicate emails in one vectorized pass. Each distinct
+        address is checked against EMAIL_RE once; per-person lines are logged in bulk at DEBUG.
+        """
         joined = birthdays_df.merge(
-            contact_df[['Emp_Id', 'First_Name', 'Last_Name', 'P_Email1']],
+            contact_df[['Emp_Id', 'First_Name', 'P_Email1']],
             on='Emp_Id', how='left', suffixes=('', '_contact')
         )
         joined['Greeting_Name'] = joined['First_Name_contact'].fillna(joined['First_Name']).astype(str).str.title()
         joined['Email'] = joined['P_Email1']
 
-        self.logger.info("People with birthdays and their email addresses:")
-        for _, row in joined.iterrows():
-            self.logger.info(
-                f"   Emp_Id={row.get('Emp_Id','N/A')}, "
-                f"Name={row.get('Greeting_Name','N/A')}, "
-                f"Email={row.get('Email','N/A')}"
-            )
-
-        email_re = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        valid = joined['Email'].notna() & joined['Email'].astype(str).str.match(email_re)
-        result = joined[valid].copy()
+        emails = joined['Email'].astype(str)
+        valid_addresses = [e for e in pd.unique(emails) if EMAIL_RE.match(e)]
+        valid = joined['Email'].notna() & emails.isin(valid_addresses)
 
         invalid = joined[~valid]
         if not invalid.empty:
-            self.logger.warning("People with invalid email addresses:")
-            for _, row in invalid.iterrows():
-                self.logger.warning(
-                    f"   Emp_Id={row.get('Emp_Id','N/A')}, "
-                    f"Name={row.get('Greeting_Name','N/A')}, "
-                    f"Email={row.get('Email','N/A')}"
-                )
+            self.logger.warning(f"{len(invalid)} people with invalid email addresses")
+            self._log_people(logging.WARNING, "People with invalid email addresses:",
+                             invalid.head(MAX_INVALID_EMAIL_LINES), ['Emp_Id', 'Greeting_Name', 'Email'],
+                             more=len(invalid) - MAX_INVALID_EMAIL_LINES)
 
-        result = result.drop_duplicates(subset=['Email'], keep='first')
+        result = joined[valid].drop_duplicates(subset=['Email'], keep='first')
 
+        self.logger.info(f"Birthday people with contact rows: {len(joined)}, valid emails: {int(valid.sum())}")
         self.logger.info(f"After email validation and deduplication: {len(result)} recipients")
-        self.logger.info("Final recipients for birthday emails:")
-        for _, row in result.iterrows():
-            self.logger.info(
-                f"   Emp_Id={row.get('Emp_Id','N/A')}, "
-                f"Name={row.get('Greeting_Name','N/A')}, "
-                f"Email={row.get('Email','N/A')}"
-            )
-        return result[['Greeting_Name', 'Email']]
+        self._log_people(logging.DEBUG, "Final recipients for birthday emails:", result, ['Emp_Id', 'Greeting_Name', 'Email'])
+        columns = ['Emp_Id', 'Greeting_Name', 'Email']
+        if 'Birthday_Date' in result.columns:
+            columns.append('Birthday_Date')
+        return result[columns]
+
+    def _log_people(self, level: int, header: str, df: pd.DataFrame, columns: List[str], more: int = 0):
+        """Log one line per row as a single record (skipped entirely when `level` is disabled)."""
+        if df.empty or not self.logger.isEnabledFor(level):
+            return
+        lines = pd.Series('   ', index=df.index)
+        for i, col in enumerate(columns):
+            values = df[col].astype(str) if col in df.columns else 'N/A'
+            lines = lines + ('' if i == 0 else ', ') + f"{col}=" + values
+        text = '\n'.join([header] + lines.tolist())
+        if more > 0:
+            text += f"\n   ... and {more} more"
+        self.logger.log(level, text)
 
     # --- Logging of send attempts ----------------------------------------------------
 
     def log_send_attempt(self, recipient: str, first_name: str, source_file: str,
                          company: str, status: str, response: str = "",
-                         message_id: str = "", spam_score: str = "N/A"):
-        today_str = datetime.now().strftime("%Y-%m-%d")
-        log_file = Path("C:/logs/birthday_sends_{today_str}.csv")
-        log_file.parent.mkdir(parents=True, exist_ok=True)
-        write_header = not log_file.exists()
-
-        try:
-            with open(log_file, 'a', newline='', encoding='utf-8') as f:
-                fieldnames = ['Timestamp', 'Recipient', 'First_Name', 'Source_File',
-                              'Company', 'Status', 'Response', 'Message_ID', 'Spam_Score']
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                if write_header:
-                    writer.writeheader()
-                writer.writerow({
-                    'Timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    'Recipient': recipient,
-                    'First_Name': first_name,
-                    'Source_File': Path(source_file).name,
-                    'Company': company,
-                    'Status': status,
-                    'Response': response,
-                    'Message_ID': message_id,
-                    'Spam_Score': spam_score
-                })
-        except Exception as e:
-            self.logger.error(f"Error writing to log file: {e}")
+                         message_id: str = "", spam_score: str = "N/A", birthday_date: Optional[date] = None):
+        """Queue one row for the per-day send log (written in batches by self.send_log)."""
+        self.send_log.write({
+            'Birthday_Date': (birthday_date or date.today()).isoformat(),
+            'Recipient': recipient,
+            'First_Name': first_name,
+            'Source_File': Path(source_file).name,
+            'Company': company,
+            'Status': status,
+            'Response': response,
+            'Message_ID': message_id,
+            'Spam_Score': spam_score
+        })
 
     # --- Email compose & send --------------------------------------------------------
 
+    def get_company_template(self, company: str, cfg: dict) -> CompanyTemplate:
+        """Return this run's template for `company`, building it on first use."""
+        template = self._templates.get(company)
+        if template is None:
+            with self._template_lock:
+                template = self._templates.get(company)
+                if template is None:
+                    template = self._build_company_template(company, cfg)
+                    self._templates[company] = template
+        return template
+
+    def _build_company_template(self, company: str, cfg: dict) -> CompanyTemplate:
+        text_template = self._load_template_file(company, '.txt') or DEFAULT_TEXT_TEMPLATE
+        html_template = self._load_template_file(company, '.html') or DEFAULT_HTML_TEMPLATE
+        site_text = self.company_sites.get(company, "") or ""
+
+        attachments, inline_parts, card_html = [], [], ''
+        card = self._build_card_part(company)
+        if card is not None:
+            part, card_html = card
+            (inline_parts if card_html else attachments).append(part)
+        generic = self._build_generic_attachment_part()
+        if generic is not None:
+            attachments.append(generic)
+
+        self.logger.info(f"[{company}] Message template ready ({len(attachments)} attachment(s), "
+                         f"{len(inline_parts)} inline image(s))")
+        return CompanyTemplate(company, cfg, text_template, html_template, site_text, attachments,
+                               inline_parts, card_html)
+
+    def _load_template_file(self, company: str, suffix: str) -> Optional[str]:
+        """
+        Read TEMPLATE_DIR/<Company><suffix>, else TEMPLATE_DIR/default<suffix>, else None. A file
+        that cannot be read, or a str.format-style one with unknown placeholders, raises ValueError
+        naming the file.
+        """
+        template_dir = self.config['template_dir']
+        if not template_dir:
+            return None
+        for name in (f"{company}{suffix}", f"default{suffix}"):
+            path = Path(template_dir) / name
+            if path.exists():
+                self.logger.info(f"[{company}] Using template {path}")
+                try:
+                    text = path.read_text(encoding='utf-8')
+                except (OSError, UnicodeDecodeError) as e:
+                    raise ValueError(f"Could not read template {path}: {e}") from e
+                strict, problems = _template_problems(text)
+                if problems and strict:
+                    raise ValueError(f"Template {path}: {', '.join(problems)} "
+                                     f"(available: {', '.join('{' + f + '}' for f in TEMPLATE_FIELDS)})")
+                return text
+        return None
+
+    def _build_card_part(self, company: str) -> Optional[Tuple[MIMEBase, str]]:
+        """
+        Read, optimize (prepare_card) and base64-encode the company birthday card once. Returns the
+        part and the HTML that shows it: with CARD_MODE=inline the card is embedded and referenced
+        by cid from the HTML body; with 'attachment' (or a non-image file) the HTML is empty and
+        the card is a regular attachment.
+        """
+        try:
+            card = self.prepare_card(company)
+            if card is None:
+                return None
+            data, subtype, filename = card
+            part = MIMEBase('image', subtype) if subtype else MIMEBase('application', 'octet-stream')
+            part.set_payload(data)
+            encoders.encode_base64(part)
+            cid = f"birthday_card_{self._token_key(company).lower()}"
+            part.add_header('Content-ID', f'<{cid}>')
+            if self.config['card_mode'] == 'inline' and subtype:
+                part.add_header('Content-Disposition', 'inline', filename=filename)
+                card_html = (f'<p style="margin: 0 0 20px 0; text-align: center;"><img src="cid:{cid}" '
+                             f'alt="Happy Birthday from {html.escape(company)}" '
+                             f'style="max-width: 100%; height: auto; border: 0;"></p>')
+            else:
+                part.add_header('Content-Disposition', 'attachment', filename=filename)
+                card_html = ''
+            self.logger.info(f"{'Embedded' if card_html else 'Attached'} birthday card for {company} "
+                             f"({len(data) / 1024:.0f} KB)")
+            return part, card_html
+        except Exception as e:
+            self.logger.warning(f"Could not attach image for {company}: {e}")
+        return None
+
+    def prepare_card(self, company: str) -> Optional[Tuple[bytes, Optional[str], str]]:
+        """
+        The company's card as (bytes, image subtype or None, filename). With CARD_OPTIMIZE and
+        Pillow installed it is downscaled to CARD_MAX_WIDTH and recompressed under CARD_MAX_KB;
+        the result is cached in CARD_CACHE_DIR under a hash of the source bytes and settings, so
+        the work is done once per card version. GIFs (possibly animated) are sent unchanged.
+        """
+        img_path = self.company_images.get(company, "") or ""
+        if not img_path:
+            return None
+        path = Path(img_path)
+        if not path.exists():
+            self.logger.warning(f"Attachment image path not found for {company}: {img_path}")
+            return None
+        source = path.read_bytes()
+        subtype = CARD_SUBTYPES.get(path.suffix.lower())
+        if not self.config['card_optimize'] or subtype == 'gif':
+            return source, subtype, path.name
+        if Image is None:
+            if len(source) > self.config['card_max_bytes']:
+                self.logger.warning(f"[{company}] Card {path.name} is {len(source) / 1024:.0f} KB; "
+                                    f"install Pillow to shrink it (pip install Pillow)")
+            return source, subtype, path.name
+
+        settings = f"{self.config['card_max_width']}|{self.config['card_max_bytes']}|{self.config['card_quality']}"
+        key = hashlib.sha256(source + settings.encode('ascii')).hexdigest()[:32]
+        cache_dir = Path(self.config['card_cache_dir'])
+        for cached in cache_dir.glob(f"{key}.*"):
+            data = cached.read_bytes()
+            if data and cached.suffix in CARD_SUBTYPES:  # never reuse a truncated entry
+                return data, CARD_SUBTYPES[cached.suffix], path.stem + cached.suffix
+
+        try:
+            data, ext = _optimize_card(source, self.config['card_max_width'], self.config['card_max_bytes'],
+                                       self.config['card_quality'])
+        except Exception as e:
+            self.logger.warning(f"[{company}] Could not optimize card {path.name} ({e}); sending it unchanged")
+            return source, subtype, path.name
+        if subtype and len(data) >= len(source):
+            data, ext = source, '.jpg' if subtype == 'jpeg' else path.suffix.lower()  # already small enough
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = cache_dir / f".{key}.{os.getpid()}.tmp"
+            tmp.write_bytes(data)
+            os.replace(tmp, cache_dir / f"{key}{ext}")
+        except OSError as e:
+            self.logger.warning(f"Could not cache optimized card for {company}: {e}")
+        self.logger.info(f"[{company}] Card {path.name}: {len(source) / 1024:.0f} KB -> {len(data) / 1024:.0f} KB")
+        return data, CARD_SUBTYPES[ext], path.stem + ext
+
+    def prepare_cards(self) -> int:
+        """Build (or find cached) optimized cards for every registered company; returns how many are ready."""
+        ready = 0
+        for company in self.company_images:
+            try:
+                if self.prepare_card(company) is not None:
+                    ready += 1
+            except Exception as e:
+                self.logger.error(f"[{company}] Could not prepare card: {e}")
+        self.logger.info(f"{ready} birthday card(s) ready")
+        return ready
+
+    def _build_generic_attachment_part(self) -> Optional[MIMEBase]:
+        """Read and encode the optional small generic attachment (<=200KB) once."""
+        if self.config['attach_path']:
+            attach_path = Path(self.config['attach_path'])
+            if attach_path.exists():
+                try:
+                    if attach_path.stat().st_size <= 200 * 1024:
+                        with open(attach_path, 'rb') as f:
+                            part = MIMEBase('application', 'octet-stream')
+                            part.set_payload(f.read())
+                        encoders.encode_base64(part)
+                        part.add_header('Content-Disposition', f'attachment; filename="{attach_path.name}"')
+                        return part
+                except Exception as e:
+                    self.logger.warning(f"Could not attach generic file: {e}")
+        return None
+
     def create_email_message(self, recipient: str, first_name: str,
                               source_filename: str, company: str, cfg: dict):
         """
         Create the email with company-specific From/Reply-To, CC/BCC, subject, body, and attach image.
-        Also set Message-ID domain from EMAIL_REPUTATION_DOMAIN when provided.
+        Also set Message-ID domain from EMAIL_REPUTATION_DOMAIN when provided. Static parts come
+        from the company's pre-built template.
         """
-        team_name = cfg['team_name_template'].format(company=company)
-        site_text = self.company_sites.get(company, "") or ""
+        with self.metrics.timer('compose', company):
+            return self._compose_message(recipient, first_name, company, cfg)
+
+    def _compose_message(self, recipient: str, first_name: str, company: str, cfg: dict):
+        template = self.get_company_template(company, cfg)
+        subject, text_body, html_body = template.render(first_name)
+
+        # text + HTML alternatives; the HTML's inline card (cid:) sits next to them in
+        # multipart/related, and regular attachments wrap all of it in multipart/mixed
+        alt = MIMEMultipart('alternative')
+        alt.attach(MIMEText(text_body, 'plain', 'utf-8'))
+        alt.attach(MIMEText(html_body, 'html', 'utf-8'))
+        body = alt
+        if template.inline_parts:
+            body = MIMEMultipart('related', type='multipart/alternative')
+            body.attach(alt)
+            for part in template.inline_parts:
+                body.attach(part)
+        if template.attachments:
+            msg = MIMEMultipart('mixed')
+            msg.attach(body)
+            # Pre-encoded attachments, shared across this company's messages
+            for part in template.attachments:
+                msg.attach(part)
+        else:
+            msg = body
 
-        msg = MIMEMultipart('mixed')  # allow attachments
-        msg['From'] = formataddr((team_name, cfg['smtp_user']))
+        msg['From'] = template.from_header
         msg['To'] = recipient
-        subject = cfg.get('subject_template', '🎉 Happy Birthday, {first_name}! - {company} Team').format(
-            first_name=first_name, company=company
-        )
         msg['Subject'] = subject
-        msg['Reply-To'] = cfg['smtp_user']
+        msg['Reply-To'] = template.smtp_user
 
         # Reputation / alignment
-        rep_domain = cfg.get('email_reputation_domain')
-        if not rep_domain:
-            try:
-                rep_domain = cfg['smtp_user'].split('@', 1)[1]
-            except Exception:
-                rep_domain = 'localhost'
-
-        message_id = make_msgid(domain=rep_domain)
+        message_id = make_msgid(domain=template.rep_domain)
         msg['Message-ID'] = message_id
-        msg['Return-Path'] = cfg['smtp_user']
-        msg['Sender'] = cfg['smtp_user']
+        msg['Return-Path'] = template.smtp_user
+        msg['Sender'] = template.smtp_user
         msg['MIME-Version'] = '1.0'
 
         # --- Simplified headers (removed non-essential headers) ---
@@ -363,171 +2141,483 @@ class BirthdayEmailSystem:
         # msg['X-MSMail-Priority'] = 'Normal'
         # msg['List-Unsubscribe'] = f'<mailto:{cfg["smtp_user"]}?subject=Unsubscribe>'
 
-        if cfg['email_cc']:
-            msg['Cc'] = ', '.join(cfg['email_cc'])
+        if template.cc_header:
+            msg['Cc'] = template.cc_header
 
-        # Alternative part for text + HTML
-        alt = MIMEMultipart('alternative')
-        msg.attach(alt)
-
-        # --- BODY (your wording, dynamic company) ---
-        text_body = f"""Dear {first_name},
-
-Here's wishing you a very Happy Birthday on behalf of our {company} Team. Hope you are having a Blast !!
-
-Be Blessed! Have a Great day!
-
-{team_name}
-{site_text}""".rstrip()
-
-        html_body = f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Happy Birthday from {company}</title>
-</head>
-<body style="font-family: Arial, Helvetica, sans-serif; line-height: 1.6; color: #333333; max-width: 600px; margin: 0 auto; padding: 20px; background-color: #ffffff;">
-    <div style="border: 1px solid #e0e0e0; padding: 30px; border-radius: 8px; background-color: #fefefe;">
-        <p style="margin: 0 0 15px 0;">Dear {first_name},</p>
-        
-        <p style="margin: 0 0 15px 0;">Here's wishing you a very Happy Birthday on behalf of our <strong>{company} Team</strong>. Hope you are having a Blast !!</p>
-        
-        <p style="margin: 0 0 15px 0;">Be Blessed! Have a Great day!</p>
-        
-        <div style="margin-top: 30px; padding-top: 20px; border-top: 1px solid #e0e0e0;">
-            <p style="margin: 0; font-weight: bold;">{team_name}</p>
-            {f'<p style="margin: 5px 0 0 0; color: #666666;">{site_text}</p>' if site_text else ''}
-        </div>
+        return msg, message_id
 
-        <div style="margin-top: 30px; font-size: 12px; color: #888888; text-align: center;">
-             <p style="font-size: 12px; color: #888888; text-align: center;">
-                 Sent with warm wishes from the {company} HR Team.  
-                 Contact: {cfg['smtp_user']}
-             </p>
-        </div>
-    </div>
-</body>
-</html>""".rstrip()
+    def _connect_smtp(self, cfg: dict) -> smtplib.SMTP:
+        """Create and return an SMTP connection using the provided company config."""
+        try:
+            with self.metrics.timer('connect', cfg['company']):
+                if cfg['smtp_port'] == 465:
+                    server = smtplib.SMTP_SSL(cfg['smtp_host'], cfg['smtp_port'], timeout=self.config['smtp_timeout'])
+                else:
+                    server = smtplib.SMTP(cfg['smtp_host'], cfg['smtp_port'], timeout=self.config['smtp_timeout'])
+                    server.starttls()
+                if cfg['use_authentication']:
+                    server.login(cfg['smtp_user'], cfg['smtp_pass'])
+                server.noop()
+        except Exception as e:
+            self._count_smtp_error(cfg['company'], 'connect', e)
+            raise
+        self.logger.info(f"Connected to SMTP server for {cfg['company']} ({cfg['smtp_host']}:{cfg['smtp_port']} - {'SSL' if cfg['smtp_port']==465 else 'STARTTLS'})")
+        return server
 
-        alt.attach(MIMEText(text_body, 'plain', 'utf-8'))
-        alt.attach(MIMEText(html_body, 'html', 'utf-8'))
+    def _open_smtp(self, cfg: dict) -> smtplib.SMTP:
+        """A warm session for the company when one passes a health check, else a new connection."""
+        while True:
+            with self._warm_lock:
+                sessions = self._warm_sessions.get(cfg['company'])
+                server = sessions.pop() if sessions else None
+            if server is None:
+                return self._connect_smtp(cfg)
+            if self._smtp_healthy(server):
+                self.logger.info(f"Using warm SMTP session for {cfg['company']}")
+                return server
+            self._close_smtp(server)
+
+    @staticmethod
+    def _smtp_healthy(server) -> bool:
+        try:
+            return server.noop()[0] == 250
+        except Exception:
+            return False
 
-        # Attach company-specific image as file attachment
-        img_path = self.company_images.get(company, "") or ""
-        if img_path and Path(img_path).exists():
+    @staticmethod
+    def _close_smtp(server):
+        try:
+            server.quit()
+        except Exception:
             try:
-                ext = Path(img_path).suffix.lower()
-                if ext in ['.jpg', '.jpeg']:
-                    maintype, subtype = 'image', 'jpeg'
-                elif ext == '.png':
-                    maintype, subtype = 'image', 'png'
-                elif ext == '.gif':
-                    maintype, subtype = 'image', 'gif'
-                else:
-                    maintype, subtype = 'application', 'octet-stream'
+                server.close()
+            except Exception:
+                pass
 
-                with open(img_path, 'rb') as f:
-                    data = f.read()
+    def _send_message(self, server, msg, cfg: dict, to_addrs: List[str]) -> dict:
+        """
+        server.send_message() equivalent that flattens the message once so its size can be counted,
+        with the call timed as the 'send' stage. Returns the refused-recipients dict.
+        """
+        data, mail_options = self._flatten_message(msg, cfg['smtp_user'], to_addrs)
+        return self._send_raw(server, data, cfg, to_addrs, mail_options)
 
-                part = MIMEBase(maintype, subtype)
-                part.set_payload(data)
-                encoders.encode_base64(part)
-                part.add_header('Content-Disposition', f'attachment; filename="{Path(img_path).name}"')
-                part.add_header('Content-ID', f'<birthday_card_{company.lower()}>')
-                msg.attach(part)
+    @staticmethod
+    def _flatten_message(msg, from_addr: str, to_addrs: List[str]) -> Tuple[bytes, tuple]:
+        """Wire bytes of `msg` plus the MAIL options they need (SMTPUTF8 for international addresses)."""
+        try:
+            ''.join([from_addr, *to_addrs]).encode('ascii')
+            policy, mail_options = msg.policy, ()
+        except UnicodeEncodeError:
+            policy, mail_options = msg.policy.clone(utf8=True), ('SMTPUTF8', 'BODY=8BITMIME')
+        with io.BytesIO() as buf:
+            BytesGenerator(buf, policy=policy).flatten(msg, linesep='\r\n')
+            return buf.getvalue(), mail_options
+
+    def _send_raw(self, server, data: bytes, cfg: dict, to_addrs: List[str], mail_options=()) -> dict:
+        company = cfg['company']
+        controller = self._rate_controller(cfg)
+        started = time.monotonic()
+        try:
+            with self.metrics.timer('send', company):
+                refused = server.sendmail(cfg['smtp_user'], to_addrs, data, mail_options)
+        except Exception as e:
+            self._count_smtp_error(company, 'send', e)
+            if controller is not None and self._classify_smtp_error(e) in ('reconnect', 'transient'):
+                self._rate_backoff(controller, cfg, getattr(e, 'smtp_code', None) or type(e).__name__)
+            raise
+        self.metrics.incr('bytes_sent', company, len(data))
+        codes = [code for code, _ in (refused or {}).values()]
+        for code in codes:
+            self.metrics.incr('smtp_errors', company, phase='send', code=str(code))
+        if controller is not None:
+            throttle_codes = [code for code in codes if 400 <= code < 500]
+            if throttle_codes:
+                self._rate_backoff(controller, cfg, throttle_codes[0])
+            else:
+                controller.success(time.monotonic() - started, cfg['send_rate_max'])
+        return refused
+
+    def _send_item(self, server, item: dict, cfg: dict) -> dict:
+        """Send one queue item: its spooled .eml bytes as stored, or the message composed in memory."""
+        to_addrs = self._envelope_recipients(item['recipient'], cfg)
+        if 'spool_file' in item:
+            data = Path(item['spool_file']).read_bytes()
+            return self._send_raw(server, data, cfg, to_addrs, item['mail_options'])
+        return self._send_message(server, item['msg'], cfg, to_addrs)
+
+    def _count_smtp_error(self, company: str, phase: str, error: Exception):
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            codes = [code for code, _ in error.recipients.values()]
+        else:
+            codes = [getattr(error, 'smtp_code', None) or type(error).__name__]
+        for code in codes:
+            self.metrics.incr('smtp_errors', company, phase=phase, code=str(code))
 
-                self.logger.info(f"Attached birthday card for {company}")
+    def _reconnect_smtp(self, cfg: dict, server) -> smtplib.SMTP:
+        """Drop a dead connection and open a new one via _connect_smtp, backing off exponentially."""
+        try:
+            server.close()
+        except Exception:
+            pass
+        attempts = max(1, self.config['smtp_reconnect_attempts'])
+        for attempt in range(1, attempts + 1):
+            try:
+                return self._connect_smtp(cfg)
             except Exception as e:
-                self.logger.warning(f"Could not attach image for {company}: {e}")
-        else:
-            if img_path:
-                self.logger.warning(f"Attachment image path not found for {company}: {img_path}")
+                if attempt == attempts:
+                    raise
+                wait = self.config['smtp_reconnect_backoff'] * (2 ** (attempt - 1))
+                self.logger.warning(f"[{cfg['company']}] Reconnect attempt {attempt}/{attempts} failed ({e}); retrying in {wait:.1f}s")
+                time.sleep(wait)
 
-        # Optional small generic attachment (<=200KB)
-        if self.config['attach_path']:
-            attach_path = Path(self.config['attach_path'])
-            if attach_path.exists():
-                try:
-                    if attach_path.stat().st_size <= 200 * 1024:
-                        with open(attach_path, 'rb') as f:
-                            part = MIMEBase('application', 'octet-stream')
-                            part.set_payload(f.read())
-                        encoders.encode_base64(part)
-                        part.add_header('Content-Disposition', f'attachment; filename="{attach_path.name}"')
-                        msg.attach(part)
-                except Exception as e:
-                    self.logger.warning(f"Could not attach generic file: {e}")
+    def _classify_smtp_error(self, error: Exception) -> str:
+        """
+        'reconnect' when the connection is gone (disconnect, 421, timeout, socket error),
+        'transient' for other 4xx replies and 'permanent' for everything else (5xx included).
+        """
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            codes = [code for code, _ in error.recipients.values()]
+            return 'transient' if codes and all(400 <= code < 500 for code in codes) else 'permanent'
+        if isinstance(error, smtplib.SMTPServerDisconnected):
+            return 'reconnect'
+        code = getattr(error, 'smtp_code', None)
+        if isinstance(code, int):
+            if code == 421:
+                return 'reconnect'
+            return 'transient' if 400 <= code < 500 else 'permanent'
+        if isinstance(error, smtplib.SMTPException):
+            return 'permanent'
+        if isinstance(error, (socket.timeout, ConnectionError, TimeoutError, OSError)):
+            return 'reconnect'
+        return 'permanent'
+
+    def _requeue_failed_send(self, item: dict, error: Exception, kind: str, queue: deque,
+                             retry_queue: deque, company: str) -> bool:
+        """
+        Put a failed send back: right away after a reconnect, or on the bounded retry queue for
+        4xx replies. Returns False when the item has used its retries (or the queue is full).
+        """
+        if item['attempts'] >= self.config['smtp_max_retries']:
+            return False
+        if kind == 'reconnect':
+            item['attempts'] += 1
+            queue.appendleft(item)
+            return True
+        if kind == 'transient' and len(retry_queue) < self.config['smtp_retry_queue_size']:
+            item['attempts'] += 1
+            retry_queue.append(item)
+            self._log_person(logging.WARNING, f"[{company}] Deferred {item['recipient']} for retry: {error}", company, item)
+            return True
+        return False
+
+    def _send_queue(self, recipients_df: pd.DataFrame) -> deque:
+        n = len(recipients_df)
+        emp_ids = recipients_df['Emp_Id'] if 'Emp_Id' in recipients_df.columns else [''] * n
+        dates = recipients_df['Birthday_Date'] if 'Birthday_Date' in recipients_df.columns else [date.today()] * n
+        return deque(
+            {'recipient': recipient, 'first_name': first_name, 'emp_id': emp_id, 'birthday_date': birthday_date,
+             'attempts': 0}
+            for recipient, first_name, emp_id, birthday_date in zip(
+                recipients_df['Email'], recipients_df['Greeting_Name'], emp_ids, dates)
+        )
 
+    @staticmethod
+    def _envelope_recipients(recipient: str, cfg: dict) -> List[str]:
+        """SMTP recipients for one birthday email: CC/BCC watchers are added unless they get a digest."""
+        if cfg['cc_mode'] == 'digest':
+            return [recipient]
+        return [recipient] + cfg['email_cc'] + cfg['email_bcc']
+
+    def create_digest_message(self, items: List[dict], source_file: str, company: str, cfg: dict):
+        """Plain-text summary of one batch for the CC/BCC watchers: who was greeted, status and Message-ID."""
+        template = self.get_company_template(company, cfg)
+        dates = sorted({item['birthday_date'] for item in items})
+        sent = sum(1 for item in items if item['status'].startswith('Sent'))
+
+        rows = [('Birthday', 'Status', 'Name', 'Email', 'Emp_Id', 'Message-ID')]
+        rows += [(item['birthday_date'].isoformat(), item['status'], str(item['first_name']), str(item['recipient']),
+                  str(item['emp_id']), item.get('message_id', '') if item['status'] != 'Failed' else '')
+                 for item in items]
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]) - 1)]
+        lines = ['  '.join(value.ljust(width) for value, width in zip(row, widths)) + '  ' + row[-1]
+                 for row in rows]
+        body = (f"Birthday emails for {company} ({self._describe_dates(dates)}) from {Path(source_file).name}\n\n"
+                f"Sent: {sent}   Not sent: {len(items) - sent}\n\n" + '\n'.join(lines) + '\n')
+
+        msg = MIMEText(body, 'plain', 'utf-8')
+        msg['From'] = template.from_header
+        msg['To'] = ', '.join(cfg['email_cc']) or template.smtp_user
+        msg['Subject'] = f"Birthday emails sent for {company} - {self._describe_dates(dates)} ({sent})"
+        message_id = make_msgid(domain=template.rep_domain)
+        msg['Message-ID'] = message_id
         return msg, message_id
 
-    def _connect_smtp(self, cfg: dict) -> smtplib.SMTP:
-        """Create and return an SMTP connection using the provided company config."""
-        if cfg['smtp_port'] == 465:
-            server = smtplib.SMTP_SSL(cfg['smtp_host'], cfg['smtp_port'], timeout=self.config['smtp_timeout'])
-        else:
-            server = smtplib.SMTP(cfg['smtp_host'], cfg['smtp_port'], timeout=self.config['smtp_timeout'])
-            server.starttls()
-        if cfg['use_authentication']:
-            server.login(cfg['smtp_user'], cfg['smtp_pass'])
-        server.noop()
-        self.logger.info(f"Connected to SMTP server for {cfg['company']} ({cfg['smtp_host']}:{cfg['smtp_port']} - {'SSL' if cfg['smtp_port']==465 else 'STARTTLS'})")
-        return server
+    def _send_digest(self, server, items: List[dict], source_file: str, company: str, cfg: dict):
+        """
+        Digest mode: send the CC/BCC watchers one message listing every birthday email of the batch
+        over the company's existing connection, instead of a copy of each email.
+        """
+        watchers = cfg['email_cc'] + cfg['email_bcc']
+        done = [item for item in items if 'status' in item]
+        if not watchers or not done:
+            return
+        msg, message_id = self.create_digest_message(done, source_file, company, cfg)
+        if self.config['dry_run']:
+            self.logger.info(f"DRY RUN: Would send digest of {len(done)} email(s) to {len(watchers)} watcher(s) [{company}]")
+            return
+        try:
+            if server is None:
+                raise RuntimeError("No SMTP connection available")
+            refused = self._send_message(server, msg, cfg, watchers)
+            status, response = ("Digest Partial Failure", str(refused)) if refused else ("Digest Sent", "Success")
+            self.logger.info(f"[{company}] Sent digest of {len(done)} email(s) to {len(watchers)} watcher(s)")
+        except Exception as e:
+            status, response = "Digest Failed", str(e)
+            self.logger.error(f"[{company}] Failed to send digest to {', '.join(watchers)}: {e}")
+        self.metrics.incr('emails', company, status=status.lower().replace(' ', '_'))
+        self.log_send_attempt(', '.join(watchers), '', source_file, company, status, response,
+                              message_id=message_id, spam_score="N/A")
 
     def send_emails(self, recipients_df: pd.DataFrame, source_file: str, company: str, cfg: dict):
-        """Send birthday emails sequentially with a small delay between sends."""
+        """
+        Send birthday emails sequentially with a small delay between sends (or via the async engine).
+        Dropped connections are re-opened and the message retried; 4xx replies go on a retry queue
+        drained at the end of the batch; 5xx replies are logged as Failed immediately.
+        """
         if self.config['dry_run']:
             self.logger.info("DRY RUN MODE - No emails will be sent")
 
         self.logger.info(f"[{company}] Using CC: {cfg['email_cc']}")
         self.logger.info(f"[{company}] Using BCC: {cfg['email_bcc']}")
+        if cfg['cc_mode'] == 'digest':
+            self.logger.info(f"[{company}] CC/BCC watchers get one digest instead of a copy of each email")
+
+        if self.shard_store is not None:
+            self._send_sharded(recipients_df, source_file, company, cfg)
+        else:
+            self._send_batch(recipients_df, source_file, company, cfg)
+
+    def _send_batch(self, recipients_df: pd.DataFrame, source_file: str, company: str, cfg: dict,
+                    spool_tag: str = '', abort: Optional[threading.Event] = None,
+                    digest: bool = True) -> List[dict]:
+        recipients_df = self._skip_completed_sends(recipients_df, company)
+        if recipients_df.empty:
+            self.logger.info(f"[{company}] All recipients were already sent; nothing to do")
+            return []
+
+        if self.config['spool_enabled']:
+            queue = self.spool_messages(recipients_df, source_file, company, cfg, spool_tag)
+            if self.config['spool_stage'] == 'compose':
+                self.logger.info(f"[{company}] {len(queue)} message(s) waiting in the outbox; not sending (compose only)")
+                return []
+        else:
+            queue = self._send_queue(recipients_df)
+        return self.deliver(queue, source_file, company, cfg, abort, digest)
+
+    def _send_sharded(self, recipients_df: pd.DataFrame, source_file: str, company: str, cfg: dict):
+        """
+        Sharded sending: split the recipients into SHARD_COUNT shards by a hash of the email (so
+        every worker computes the same split) and send each shard this worker manages to lease.
+        When no shard is free the worker keeps waiting while other workers hold leases and takes
+        over any lease that expires, so the file is finished even if a worker dies. In digest mode
+        the worker that finishes the last shard sends the one digest, built from every shard's items.
+        """
+        store, owner, count = self.shard_store, self.config['shard_worker_id'], self.config['shard_count']
+        if 'Birthday_Date' in recipients_df.columns:
+            dates = sorted(set(recipients_df['Birthday_Date']))
+        else:
+            dates = [date.today()]
+        run_key = self.config['shard_run_id'] or ','.join(d.isoformat() for d in dates)
+        source = Path(source_file).name
+        shards = recipients_df['Email'].map(
+            lambda email: int.from_bytes(hashlib.sha1(SendLedger.normalize(email).encode('utf-8')).digest()[:8],
+                                         'big') % count)
+
+        state = store.register(run_key, source, count, rerun=self.config['shard_rerun'])
+        if state == 'finished':
+            self.logger.info(f"[{company}] Sharded run {run_key} of {source} is already finished; "
+                             f"pass --rerun (or a new SHARD_RUN_ID) to send it again")
+            return
+        if state == 'restarted':
+            self.logger.info(f"[{company}] Starting sharded run {run_key} of {source} again (--rerun)")
+        while True:
+            claimed = store.claim(run_key, source, owner)
+            if claimed is None:
+                expiry = store.next_expiry(run_key, source)
+                if expiry is None:
+                    break
+                time.sleep(min(max(expiry - time.time(), 0.5), 5.0))
+                continue
+            shard, previous = claimed
+            part = recipients_df[shards == shard]
+            if previous:
+                self.logger.warning(f"[{company}] Taking over shard {shard + 1}/{count} of {source} from "
+                                    f"{previous} (lease expired)")
+                self.metrics.incr('shard_takeovers', company)
+            self.logger.info(f"[{company}] Shard {shard + 1}/{count} of {source}: {len(part)} recipient(s)")
+            self.metrics.incr('shards', company)
+            items = []
+            try:
+                with self._keep_lease(run_key, source, shard) as lease_lost:
+                    if not part.empty:
+                        items = self._send_batch(part, source_file, company, cfg, spool_tag=f"shard{shard:03d}",
+                                                 abort=lease_lost, digest=False)
+            except Exception:
+                store.release(run_key, source, shard, owner)
+                raise
+            if lease_lost.is_set():
+                continue  # the worker that took the shard over finishes it
+            last = store.finish(run_key, source, shard, owner, [item for item in items if 'status' in item])
+            if last and cfg['cc_mode'] == 'digest':
+                self._send_run_digest(store.results(run_key, source), source_file, company, cfg)
+        self.logger.info(f"[{company}] All {count} shards of {source} are done")
+
+    def _send_run_digest(self, items: List[dict], source_file: str, company: str, cfg: dict):
+        """Send the digest of a whole sharded run over a connection of its own."""
+        server = None
+        try:
+            if items and not self.config['dry_run']:
+                try:
+                    server = self._open_smtp(cfg)
+                except Exception as e:
+                    self.logger.error(f"SMTP connection failed for {company}: {e}")
+            self._send_digest(server, items, source_file, company, cfg)
+        finally:
+            if server is not None:
+                self._close_smtp(server)
+
+    @contextmanager
+    def _keep_lease(self, run_key: str, source: str, shard: int):
+        """
+        Renew a shard's lease in the background (every third of SHARD_LEASE_SECONDS) while it is
+        sent. Yields an event that is set when the lease has been taken over by another worker;
+        deliver() stops sending once it is set, so the shard is not sent twice.
+        """
+        store, owner = self.shard_store, self.config['shard_worker_id']
+        stop = threading.Event()
+        lost = threading.Event()
+
+        def renew():
+            while not stop.wait(store.lease_seconds / 3):
+                try:
+                    if not store.renew(run_key, source, shard, owner):
+                        self.logger.error(f"Lost the lease on shard {shard + 1} of {source} to another worker; "
+                                          f"stopping its sends")
+                        lost.set()
+                        return
+                except Exception as e:
+                    self.logger.warning(f"Could not renew the lease on shard {shard + 1} of {source}: {e}")
+
+        thread = threading.Thread(target=renew, name=f"{threading.current_thread().name}-lease", daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            stop.set()
+            thread.join()
+
+    def deliver(self, queue: deque, source_file: str, company: str, cfg: dict,
+                abort: Optional[threading.Event] = None, digest: bool = True) -> List[dict]:
+        """
+        Send stage for a queue of items from _send_queue (composed as they are sent) or from the
+        outbox spool (pre-flattened .eml bytes), with the engine chosen by SEND_ENGINE. When
+        `abort` is set (shard lease lost) the remaining items are left unsent. Returns the items;
+        those that were sent or failed carry a 'status'. `digest=False` leaves the CC/BCC digest
+        to the caller (sharded runs send one for the whole file).
+        """
+        if not queue:
+            self.logger.info(f"[{company}] Nothing left to send")
+            return []
+        items = list(queue)
+        digest = digest and cfg['cc_mode'] == 'digest'
+
+        if self.config['send_engine'] == 'async' and not self.config['dry_run']:
+            sent_count, failed_count = asyncio.run(
+                self._send_emails_async(queue, source_file, company, cfg, abort, digest))
+            self.logger.info(f"[{company}] Email sending summary: Sent={sent_count} Failed={failed_count}",
+                             extra={'company': company})
+            return items
 
         server = None
         try:
             if not self.config['dry_run']:
                 try:
-                    server = self._connect_smtp(cfg)
+                    server = self._open_smtp(cfg)
                 except Exception as e:
                     self.logger.error(f"SMTP connection failed for {company}: {str(e)}")
                     raise
 
             sent_count = 0
             failed_count = 0
-
-            for _, row in recipients_df.iterrows():
-                recipient = row['Email']
-                first_name = row['Greeting_Name']
+            controller = None if self.config['dry_run'] else self._rate_controller(cfg)
+            retry_queue: deque = deque()
+
+            while queue:
+                if abort is not None and abort.is_set():
+                    self.logger.warning(f"[{company}] Stopping with {len(queue) + len(retry_queue)} message(s) unsent")
+                    queue.clear()
+                    retry_queue.clear()
+                    break
+                item = queue.popleft()
+                recipient = item['recipient']
+                first_name = item['first_name']
 
                 try:
-                    msg, message_id = self.create_email_message(recipient, first_name, Path(source_file).name, company, cfg)
-                    all_recipients = [recipient] + cfg['email_cc'] + cfg['email_bcc']
-
-                    if self.config['dry_run']:
-                        status, response = "Sent (Dry Run)", "Dry run mode"
-                        self.logger.info(f"DRY RUN: Would send to {recipient} ({first_name}) [{company}]")
-                        self.log_send_attempt(recipient, first_name, source_file, company, status, response,
-                                               message_id=message_id, spam_score="N/A")
-                    else:
-                        send_result = server.send_message(msg, from_addr=cfg['smtp_user'], to_addrs=all_recipients)
-                        if send_result:
-                            status, response = "Partial Failure", str(send_result)
-                            failed_count += 1
-                        else:
-                            status, response = "Sent", "Success"
+                    if 'msg' not in item and 'spool_file' not in item:
+                        item['msg'], item['message_id'] = self.create_email_message(
+                            recipient, first_name, Path(source_file).name, company, cfg)
+                except Exception as e:
+                    self._log_send_failure(item, source_file, company, e)
+                    failed_count += 1
+                    continue
+
+                if self.config['dry_run']:
+                    status, response = "Sent (Dry Run)", "Dry run mode"
+                    item['status'] = status
+                    self._log_person(logging.INFO, f"DRY RUN: Would send to {recipient} ({first_name}) [{company}]",
+                                     company, item)
+                    self.metrics.incr('emails', company, status='dry_run')
+                    self.log_send_attempt(recipient, first_name, source_file, company, status, response,
+                                          message_id=item['message_id'], spam_score="N/A",
+                                          birthday_date=item['birthday_date'])
+                else:
+                    if controller is not None:
+                        time.sleep(controller.delay(cfg['send_rate_min'], cfg['send_rate_max']))
+                    try:
+                        send_result = self._send_item(server, item, cfg)
+                        if self._log_send_result(item, source_file, company, send_result):
                             sent_count += 1
+                        else:
+                            failed_count += 1
+                    except Exception as e:
+                        kind = self._classify_smtp_error(e)
+                        if kind == 'reconnect':
+                            self.logger.warning(f"[{company}] SMTP connection lost ({e}); reconnecting")
+                            try:
+                                server = self._reconnect_smtp(cfg, server)
+                            except Exception as reconnect_error:
+                                self.logger.error(f"[{company}] Could not reconnect to SMTP server: {reconnect_error}")
+                                for pending in [item, *queue, *retry_queue]:
+                                    self._log_send_failure(pending, source_file, company, reconnect_error)
+                                    failed_count += 1
+                                server = None
+                                break
+                        if not self._requeue_failed_send(item, e, kind, queue, retry_queue, company):
+                            self._log_send_failure(item, source_file, company, e)
+                            failed_count += 1
 
-                        self.logger.info(f"Sent birthday email to {recipient} ({first_name}) [{company}]")
-                        self.log_send_attempt(recipient, first_name, source_file, company, status, response,
-                                               message_id=message_id, spam_score="N/A")
-
-                        # pacing between individual sends
+                    # pacing between individual sends
+                    if controller is None:
                         time.sleep(self.config['delay_between_sends'])
 
-                except Exception as e:
-                    self.logger.error(f"Failed to send email to {recipient}: {str(e)}")
-                    self.log_send_attempt(recipient, first_name, source_file, company, "Failed", str(e),
-                                           message_id="", spam_score="N/A")
-                    failed_count += 1
+                if not queue and retry_queue:
+                    self.logger.info(f"[{company}] Retrying {len(retry_queue)} deferred send(s) in {self.config['smtp_retry_delay']}s")
+                    time.sleep(self.config['smtp_retry_delay'])
+                    queue, retry_queue = retry_queue, deque()
+
+            if digest and not (abort is not None and abort.is_set()):
+                self._send_digest(server, items, source_file, company, cfg)
 
             if not self.config['dry_run'] and server is not None:
                 try:
@@ -536,70 +2626,981 @@ Be Blessed! Have a Great day!
                     pass
                 self.logger.info("Disconnected from SMTP server")
 
-            self.logger.info(f"[{company}] Email sending summary: Sent={sent_count} Failed={failed_count}")
+            self.logger.info(f"[{company}] Email sending summary: Sent={sent_count} Failed={failed_count}",
+                             extra={'company': company})
+            return items
 
         except Exception as e:
             self.logger.error(f"SMTP connection error for {company}: {str(e)}")
             raise
 
-    # --- Orchestration ---------------------------------------------------------------
+    def _log_send_result(self, item: dict, source_file: str, company: str, send_result: dict) -> bool:
+        """
+        Log a completed send for a queue item and record it in the resume ledger (under its
+        birthday date) when the birthday person received it. Returns False when some recipients
+        were refused.
+        """
+        recipient, first_name = item['recipient'], item['first_name']
+        if send_result:
+            status, response = "Partial Failure", str(send_result)
+        else:
+            status, response = "Sent", "Success"
+        item['status'] = status
+        self.metrics.incr('emails', company, status='partial' if send_result else 'sent')
+
+        self._log_person(logging.INFO, f"Sent birthday email to {recipient} ({first_name}) [{company}]", company, item)
+        self.log_send_attempt(recipient, first_name, source_file, company, status, response,
+                              message_id=item['message_id'], spam_score="N/A", birthday_date=item['birthday_date'])
+        if self.send_ledger is not None and recipient not in (send_result or {}):
+            try:
+                self.send_ledger.record(item['birthday_date'].isoformat(), company, recipient,
+                                        item['emp_id'], item['message_id'])
+            except Exception as e:
+                self.logger.error(f"Could not record send to {recipient} in the ledger: {e}")
+        if 'spool_file' in item and recipient not in (send_result or {}):
+            self._mark_spool_sent(item)
+        return not send_result
 
-    def process_file(self, excel_path: str):
-        """Process a single Excel file for birthday emails."""
+    def _log_person(self, level: int, message: str, company: str, item: dict):
+        """
+        Log one per-person line with company/Emp_Id/Message-ID fields (used by LOG_JSON). INFO
+        lines follow LOG_PER_PERSON: all, sample (every LOG_SAMPLE_EVERY-th) or summary (none);
+        warnings and errors are always logged.
+        """
+        if level < logging.WARNING:
+            mode = self.config['log_per_person']
+            if mode == 'summary':
+                return
+            if mode == 'sample' and next(self._person_log_seq) % self.config['log_sample_every']:
+                return
+        self.logger.log(level, message, extra={'company': company, 'emp_id': item.get('emp_id'),
+                                               'message_id': item.get('message_id')})
+
+    def _skip_completed_sends(self, recipients_df: pd.DataFrame, company: str) -> pd.DataFrame:
+        """Drop recipients the ledger says were already greeted for their birthday date at this company."""
+        if self.send_ledger is None:
+            return recipients_df
+        if 'Birthday_Date' in recipients_df.columns:
+            birthday_dates = recipients_df['Birthday_Date']
+        else:
+            birthday_dates = pd.Series(date.today(), index=recipients_df.index)
+        emails = recipients_df['Email'].astype(str).str.strip().str.lower()
+        already = pd.Series(False, index=recipients_df.index)
+        for birthday_date in pd.unique(birthday_dates):
+            done = self.send_ledger.completed(birthday_date.isoformat(), company)
+            if done:
+                already |= (birthday_dates == birthday_date) & emails.isin(done)
+        if already.any():
+            self.logger.info(f"[{company}] Skipping {int(already.sum())} recipient(s) already sent (send ledger)")
+        return recipients_df[~already]
+
+    def _log_send_failure(self, item: dict, source_file: str, company: str, error: Exception):
+        self._log_person(logging.ERROR, f"Failed to send email to {item['recipient']}: {str(error)}", company, item)
+        item['status'] = "Failed"
+        self.metrics.incr('emails', company, status='failed')
+        self.log_send_attempt(item['recipient'], item['first_name'], source_file, company, "Failed", str(error),
+                              message_id="", spam_score="N/A", birthday_date=item['birthday_date'])
+
+    async def _send_emails_async(self, queue: deque, source_file: str, company: str,
+                                 cfg: dict, abort: Optional[threading.Event] = None,
+                                 digest: bool = True) -> Tuple[int, int]:
+        """
+        Async engine: open a small pool of SMTP connections via _connect_smtp and let one worker per
+        connection drain the shared recipient list. A per-company token bucket (send_rate/send_burst)
+        replaces the fixed delay between sends. Blocking smtplib calls run on a dedicated thread pool.
+        """
+        loop = asyncio.get_running_loop()
+        pool_size = max(1, min(cfg['smtp_pool_size'], len(queue)))
+        executor = ThreadPoolExecutor(max_workers=pool_size)
+        try:
+            opened = await asyncio.gather(
+                *(loop.run_in_executor(executor, self._open_smtp, cfg) for _ in range(pool_size)),
+                return_exceptions=True
+            )
+            servers = [c for c in opened if not isinstance(c, BaseException)]
+            errors = [c for c in opened if isinstance(c, BaseException)]
+            if not servers:
+                self.logger.error(f"SMTP connection failed for {company}: {str(errors[0])}")
+                raise errors[0]
+            for e in errors:
+                self.logger.warning(f"[{company}] Opened {len(servers)}/{pool_size} SMTP connections: {e}")
+
+            controller = self._rate_controller(cfg)
+            if controller is None:
+                self.logger.info(f"[{company}] Async send: {len(servers)} connections, "
+                                 f"rate={cfg['send_rate']}/s burst={cfg['send_burst']}")
+            else:
+                self.logger.info(f"[{company}] Async send: {len(servers)} connections, adaptive rate "
+                                 f"{cfg['send_rate_min']}-{cfg['send_rate_max']}/s")
+            bucket = TokenBucket(cfg['send_rate'], cfg['send_burst'])
+            items = list(queue)
+            retry_queue: deque = deque()
+            counts = {'sent': 0, 'failed': 0}
+
+            def aborted() -> bool:
+                return abort is not None and abort.is_set()
+
+            async def worker(slot: int):
+                while queue and not aborted():
+                    item = queue.popleft()
+                    recipient, first_name = item['recipient'], item['first_name']
+                    try:
+                        if 'msg' not in item and 'spool_file' not in item:
+                            item['msg'], item['message_id'] = self.create_email_message(
+                                recipient, first_name, Path(source_file).name, company, cfg)
+                    except Exception as e:
+                        self._log_send_failure(item, source_file, company, e)
+                        counts['failed'] += 1
+                        continue
+
+                    if controller is None:
+                        await bucket.acquire()
+                    else:
+                        await asyncio.sleep(controller.delay(cfg['send_rate_min'], cfg['send_rate_max']))
+                    if aborted():
+                        queue.appendleft(item)
+                        return
+                    try:
+                        send_result = await loop.run_in_executor(executor, self._send_item, servers[slot], item, cfg)
+                        ok = self._log_send_result(item, source_file, company, send_result)
+                        counts['sent' if ok else 'failed'] += 1
+                    except Exception as e:
+                        kind = self._classify_smtp_error(e)
+                        if kind == 'reconnect':
+                            self.logger.warning(f"[{company}] SMTP connection {slot + 1} lost ({e}); reconnecting")
+                            try:
+                                servers[slot] = await loop.run_in_executor(
+                                    executor, self._reconnect_smtp, cfg, servers[slot])
+                            except Exception as reconnect_error:
+                                # this connection is finished; other workers keep draining the queue
+                                self.logger.error(f"[{company}] Could not reconnect SMTP connection {slot + 1}: {reconnect_error}")
+                                servers[slot] = None
+                                queue.appendleft(item)
+                                return
+                        if not self._requeue_failed_send(item, e, kind, queue, retry_queue, company):
+                            self._log_send_failure(item, source_file, company, e)
+                            counts['failed'] += 1
+
+            while True:
+                if aborted():
+                    self.logger.warning(f"[{company}] Stopping with {len(queue) + len(retry_queue)} message(s) unsent")
+                    queue.clear()
+                    retry_queue.clear()
+                    break
+                alive = [slot for slot, server in enumerate(servers) if server is not None]
+                if queue and not alive:
+                    # every connection is gone; whatever is left cannot be sent
+                    for item in [*queue, *retry_queue]:
+                        self._log_send_failure(item, source_file, company, RuntimeError("No SMTP connection available"))
+                        counts['failed'] += 1
+                    break
+                if queue:
+                    await asyncio.gather(*(worker(slot) for slot in alive))
+                    continue
+                if not retry_queue:
+                    break
+                self.logger.info(f"[{company}] Retrying {len(retry_queue)} deferred send(s) in {self.config['smtp_retry_delay']}s")
+                await asyncio.sleep(self.config['smtp_retry_delay'])
+                queue.extend(retry_queue)
+                retry_queue.clear()
+
+            if digest and not aborted():
+                alive = [server for server in servers if server is not None]
+                await loop.run_in_executor(executor, self._send_digest, alive[0] if alive else None,
+                                           items, source_file, company, cfg)
+
+            for server in servers:
+                if server is None:
+                    continue
+                try:
+                    await loop.run_in_executor(executor, server.quit)
+                except Exception:
+                    pass
+            self.logger.info("Disconnected from SMTP server")
+            return counts['sent'], counts['failed']
+        finally:
+            executor.shutdown(wait=False)
+
+    # --- Adaptive send rate ----------------------------------------------------------
+
+    def _rate_controller(self, cfg: dict) -> Optional[AdaptiveRateController]:
+        """The shared controller for cfg's SMTP relay when RATE_CONTROL=adaptive, else None."""
+        if self.config['rate_control'] != 'adaptive':
+            return None
+        relay = f"{cfg['smtp_host']}:{cfg['smtp_port']}"
+        with self._rate_lock:
+            controller = self._rate_controllers.get(relay)
+            if controller is None:
+                learned = self._load_rate_state().get(relay, {}).get('rate')
+                if learned:
+                    rate = float(learned)
+                elif self.config['send_engine'] != 'async':
+                    delay = self.config['delay_between_sends']
+                    rate = 1.0 / delay if delay > 0 else cfg['send_rate_max']
+                else:
+                    rate = cfg['send_rate'] if cfg['send_rate'] > 0 else cfg['send_rate_max']
+                rate = min(max(rate, cfg['send_rate_min']), cfg['send_rate_max'])
+                self.logger.info(f"[{cfg['company']}] Adaptive send rate for {relay} starts at {rate:.2f}/s"
+                                 + (" (learned)" if learned else ""))
+                controller = AdaptiveRateController(rate, self.config['rate_increase'], self.config['rate_backoff'],
+                                                    self.config['rate_latency_target'])
+                self._rate_controllers[relay] = controller
+        return controller
+
+    def _rate_backoff(self, controller: AdaptiveRateController, cfg: dict, reason):
+        change = controller.throttled(cfg['send_rate_min'])
+        if change is None:
+            return
+        self.metrics.incr('rate_backoffs', cfg['company'])
+        self.logger.warning(f"[{cfg['company']}] {cfg['smtp_host']} is throttling ({reason}); "
+                            f"send rate {change[0]:.2f}/s -> {change[1]:.2f}/s")
+
+    def _load_rate_state(self) -> dict:
+        path = Path(self.config['rate_state_file'])
+        if not path.exists():
+            return {}
+        try:
+            return json.loads(path.read_text(encoding='utf-8'))
+        except Exception as e:
+            self.logger.warning(f"Could not read learned send rates from {path}: {e}")
+            return {}
+
+    def save_rate_state(self):
+        """Persist every relay's learned rate to RATE_STATE_FILE so the next run starts from it."""
+        if not self._rate_controllers:
+            return
+        state = self._load_rate_state()
+        updated = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._rate_lock:
+            for relay, controller in self._rate_controllers.items():
+                state[relay] = {'rate': round(controller.rate, 3), 'updated': updated}
         try:
-            self.logger.info(f"Processing file: {excel_path}")
+            _write_atomic(self.config['rate_state_file'], json.dumps(state, indent=2, sort_keys=True))
+        except Exception as e:
+            self.logger.error(f"Could not write learned send rates to {self.config['rate_state_file']}: {e}")
+            return
+        self.logger.info("Learned send rates: " + ", ".join(
+            f"{relay}={controller.rate:.2f}/s" for relay, controller in self._rate_controllers.items()))
 
-            company = self.detect_company_from_path(excel_path)
-            self.logger.info(f"Company for this file: {company}")
-            company_cfg = self.get_company_config(company)
+    # --- Outbox spool ----------------------------------------------------------------
 
-            confidential_df, contact_df, status_df = self.load_and_validate_data(excel_path)
-            birthdays_df = self.filter_todays_birthdays(confidential_df, status_df)
-            if birthdays_df.empty:
-                return
+    def spool_messages(self, recipients_df: pd.DataFrame, source_file: str, company: str, cfg: dict,
+                       spool_tag: str = '') -> deque:
+        """
+        Compose stage: render every recipient's message into the outbox spool (SPOOL_DIR/<birthday
+        date>/<company>/: numbered .eml files plus manifest.jsonl) and return the queue of spooled
+        items still to send. Messages spooled by an earlier run are reused as they are, so an
+        interrupted run resumes without composing them again. `spool_tag` gives each shard its
+        own directory (<company>-<tag>), so shard workers never share a manifest.
+        """
+        queue: deque = deque()
+        jobs = []
+        manifests: Dict[Path, dict] = {}
+        already_sent = 0
+        for item in self._send_queue(recipients_df):
+            directory = self._spool_path(item['birthday_date'], company, spool_tag)
+            if directory not in manifests:
+                directory.mkdir(parents=True, exist_ok=True)
+                entries = self._read_spool_manifest(directory)
+                manifests[directory] = {'entries': {str(e['recipient']).strip().lower(): e for e in entries},
+                                        'next': self._next_spool_number(directory, entries)}
+            manifest = manifests[directory]
+            entry = manifest['entries'].get(str(item['recipient']).strip().lower())
+            if entry is not None and (directory / entry['file']).exists():
+                queue.append(self._spool_item(entry, directory))
+            elif entry is not None and (directory / (entry['file'] + SPOOL_SENT_SUFFIX)).exists():
+                already_sent += 1
+            else:
+                item['spool_file'] = str(directory / f"{manifest['next']:06d}.eml")
+                manifest['next'] += 1
+                jobs.append(item)
+        if already_sent:
+            self.logger.info(f"[{company}] Skipping {already_sent} recipient(s) already sent from the outbox")
+        if queue:
+            self.logger.info(f"[{company}] Reusing {len(queue)} message(s) already in the outbox")
+        if jobs:
+            queue.extend(self._compose_to_spool(jobs, source_file, company, cfg))
+        return queue
+
+    def _compose_to_spool(self, jobs: List[dict], source_file: str, company: str, cfg: dict) -> List[dict]:
+        """
+        Compose and write the .eml files for `jobs`, then append them to their manifests. Batches
+        larger than SPOOL_CHUNK_SIZE are split across COMPOSE_WORKERS processes.
+        """
+        source_name = Path(source_file).name
+        chunks = [jobs[i:i + SPOOL_CHUNK_SIZE] for i in range(0, len(jobs), SPOOL_CHUNK_SIZE)]
+        workers = max(1, min(self.config['compose_workers'], len(chunks)))
+        self.logger.info(f"[{company}] Composing {len(jobs)} message(s) into the outbox"
+                         + (f" with {workers} compose workers" if workers > 1 else ""))
+        with self.metrics.timer('spool', company):
+            if workers == 1:
+                results = [self._compose_spool_chunk(chunk, source_name, company, cfg) for chunk in chunks]
+            else:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker,
+                                         initargs=('compose',)) as pool:
+                    futures = [pool.submit(self._compose_spool_chunk_in_worker, chunk, source_name, company, cfg)
+                               for chunk in chunks]
+                    results = []
+                    for future in futures:
+                        entries, worker_metrics = future.result()
+                        self.metrics.merge(worker_metrics)
+                        results.append(entries)
+
+        items, lines = [], {}
+        for job, entry in zip(jobs, (entry for entries in results for entry in entries)):
+            if 'error' in entry:
+                self._log_send_failure(job, source_file, company, RuntimeError(entry['error']))
+                continue
+            directory = Path(job['spool_file']).parent
+            lines.setdefault(directory, []).append(json.dumps(entry, default=str) + '\n')
+            items.append(self._spool_item(entry, directory))
+        for directory, batch in lines.items():
+            with open(directory / SPOOL_MANIFEST, 'a', encoding='utf-8') as f:
+                f.writelines(batch)
+        self.metrics.incr('spooled', company, len(items))
+        return items
+
+    def _compose_spool_chunk(self, jobs: List[dict], source_name: str, company: str, cfg: dict) -> List[dict]:
+        """Compose, flatten and write one .eml per job; returns one manifest entry (or error) per job."""
+        entries = []
+        for job in jobs:
+            path = Path(job['spool_file'])
+            try:
+                if path.exists() or path.with_name(path.name + SPOOL_SENT_SUFFIX).exists():
+                    raise FileExistsError(f"outbox file {path} already exists")
+                msg, message_id = self.create_email_message(job['recipient'], job['first_name'],
+                                                            source_name, company, cfg)
+                data, mail_options = self._flatten_message(
+                    msg, cfg['smtp_user'], self._envelope_recipients(job['recipient'], cfg))
+                tmp = path.with_name(path.name + '.tmp')
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+            except Exception as e:
+                entries.append({'error': str(e)})
+                continue
+            entries.append({'file': path.name, 'company': company, 'source_file': source_name,
+                            'recipient': job['recipient'], 'first_name': job['first_name'],
+                            'emp_id': job['emp_id'], 'birthday_date': job['birthday_date'].isoformat(),
+                            'message_id': message_id, 'mail_options': list(mail_options)})
+        return entries
+
+    @staticmethod
+    def _next_spool_number(directory: Path, entries: List[dict]) -> int:
+        """
+        First free .eml number in `directory`: one past the highest number in the manifest or on
+        disk (pending or .sent). Messages that failed to compose have no manifest line but may
+        have used a number, so counting manifest entries is not enough.
+        """
+        names = [e.get('file', '') for e in entries] + [p.name for p in directory.glob('*.eml*')]
+        numbers = [int(m.group(1)) for m in map(re.compile(r'^(\d+)\.eml').match, names) if m]
+        return max(numbers, default=-1) + 1
+
+    def _compose_spool_chunk_in_worker(self, jobs: List[dict], source_name: str, company: str, cfg: dict):
+        """Compose-pool entry point: the chunk's manifest entries plus this process's metrics."""
+        return self._compose_spool_chunk(jobs, source_name, company, cfg), self.metrics.snapshot()
+
+    def _spool_path(self, birthday_date: date, company: str, spool_tag: str = '') -> Path:
+        name = self._token_key(company).lower() + (f"-{spool_tag}" if spool_tag else '')
+        return Path(self.config['spool_dir']) / birthday_date.isoformat() / name
+
+    def _read_spool_manifest(self, directory: Path) -> List[dict]:
+        path = directory / SPOOL_MANIFEST
+        if not path.exists():
+            return []
+        entries = []
+        with open(path, encoding='utf-8') as f:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # a line cut short by a crash; its message is simply composed again
+                    self.logger.warning(f"Ignoring unreadable line {line_no} of {path}")
+        return entries
+
+    @staticmethod
+    def _spool_item(entry: dict, directory: Path) -> dict:
+        return {'recipient': entry['recipient'], 'first_name': entry['first_name'], 'emp_id': entry['emp_id'],
+                'birthday_date': date.fromisoformat(entry['birthday_date']), 'attempts': 0,
+                'message_id': entry['message_id'], 'spool_file': str(directory / entry['file']),
+                'mail_options': tuple(entry['mail_options'])}
+
+    def _mark_spool_sent(self, item: dict):
+        try:
+            os.replace(item['spool_file'], item['spool_file'] + SPOOL_SENT_SUFFIX)
+        except OSError as e:
+            self.logger.warning(f"Could not mark {item['spool_file']} as sent: {e}")
 
-            recipients_df = self.join_email_data(birthdays_df, contact_df)
-            if recipients_df.empty:
-                self.logger.warning("No valid email addresses found for birthday recipients")
-                return
+    def send_spool(self, dates: Optional[List[date]] = None):
+        """
+        Send stage on its own (--send-spool): drain the outbox for `dates` (default today) without
+        reading any workbook. Pending .eml files go out byte for byte; sent ones are skipped.
+        """
+        dates = sorted(set(dates or [date.today()]))
+        self.logger.info(f"Sending the outbox for {self._describe_dates(dates)}")
+        self._templates.clear()
+        self.metrics = RunMetrics()
+        batches: Dict[Tuple[str, str], deque] = {}
+        for birthday_date in dates:
+            day_dir = Path(self.config['spool_dir']) / birthday_date.isoformat()
+            if not day_dir.is_dir():
+                continue
+            for directory in sorted(p for p in day_dir.iterdir() if p.is_dir()):
+                for entry in self._read_spool_manifest(directory):
+                    if (directory / entry['file']).exists():
+                        batch = batches.setdefault((entry['company'], entry['source_file']), deque())
+                        batch.append(self._spool_item(entry, directory))
+        if not batches:
+            self.logger.info("Outbox is empty; nothing to send")
+        try:
+            for idx, ((company, source_file), queue) in enumerate(batches.items()):
+                try:
+                    cfg = self.get_company_config(company)
+                    self.deliver(self._skip_completed_items(queue, company), source_file, company, cfg)
+                except Exception as e:
+                    self.logger.error(f"[{company}] Could not send the outbox for {source_file}: {e}")
+                if idx < len(batches) - 1 and self.config['rate_control'] != 'adaptive':
+                    time.sleep(self.config['delay_between_companies'])
+        finally:
+            self.send_log.flush()
+            self.export_metrics()
+            self.save_rate_state()
+
+    def _skip_completed_items(self, queue: deque, company: str) -> deque:
+        """Drop spooled items the ledger already has (sent, but the run stopped before marking the file)."""
+        if self.send_ledger is None:
+            return queue
+        done = {}
+        remaining = deque()
+        for item in queue:
+            key = item['birthday_date'].isoformat()
+            if key not in done:
+                done[key] = self.send_ledger.completed(key, company)
+            if self.send_ledger.normalize(item['recipient']) in done[key]:
+                self._mark_spool_sent(item)
+            else:
+                remaining.append(item)
+        return remaining
 
-            self.send_emails(recipients_df, excel_path, company, company_cfg)
+    # --- Orchestration ---------------------------------------------------------------
+
+    def load_company_data(self, excel_path: str, dates: Optional[List[date]] = None):
+        """
+        Load stage for one workbook: (confidential, contact, status, birthday index), or None when
+        the lazy precheck finds no birthdays on `dates` (default: today). Runs in a parse worker
+        process in concurrent mode.
+        """
+        with self.metrics.timer('load', self._company_for_path(excel_path)):
+            return self._load_company_data(excel_path, dates or [date.today()])
+
+    def _load_company_data_in_worker(self, excel_path: str, dates: Optional[List[date]] = None):
+        """Parse-pool entry point: the load result plus this process's metrics for the parent to merge."""
+        return self.load_company_data(excel_path, dates), self.metrics.snapshot()
+
+    def _load_company_data(self, excel_path: str, dates: List[date]):
+        # With the cache on, one full parse serves every later run; a precheck would never fill it
+        # and, on a birthday, would read Confidential twice.
+        if self.config['lazy_load'] and not self.config['cache_enabled']:
+            frames = self.load_todays_birthday_data(excel_path, dates)
+            if frames is None:
+                self.logger.info(f"No birthdays on {self._describe_dates(dates)}. Exiting.")
+                return None
+            confidential_df, contact_df, status_df = frames
+        else:
+            confidential_df, contact_df, status_df = self.load_and_validate_data(excel_path)
+        index = self.load_birthday_index(excel_path, confidential_df)
+        return confidential_df, contact_df, status_df, index
 
+    def process_file(self, excel_path: str, data=None, dates: Optional[List[date]] = None):
+        """
+        Process a single Excel file for birthday emails on `dates` (default: today), all selected in
+        one pass and sent over one SMTP session. `data` is a pre-loaded load_company_data result.
+        """
+        try:
+            prepared = self.prepare_file(excel_path, data, dates)
+            if prepared is not None:
+                company, company_cfg, recipients_df = prepared
+                self.send_emails(recipients_df, excel_path, company, company_cfg)
         except Exception as e:
             self.logger.error(f"Error processing file {excel_path}: {str(e)}")
             raise
 
-    def run(self, excel_files: List[str]):
+    def prepare_file(self, excel_path: str, data=None, dates: Optional[List[date]] = None):
+        """
+        Load, filter and join stage of process_file: (company, cfg, recipients) or None when nobody
+        is left to greet. During a run with cross-company dedup the recipients are claimed here,
+        and anyone already claimed by another company is dropped.
+        """
+        dates = dates or [date.today()]
+        self.logger.info(f"Processing file: {excel_path}")
+
+        company = self.detect_company_from_path(excel_path)
+        self.logger.info(f"Company for this file: {company}")
+        company_cfg = self.get_company_config(company)
+
+        if data is None:
+            data = self.load_company_data(excel_path, dates)
+            if data is None:
+                return None
+        confidential_df, contact_df, status_df, index = data
+        with self.metrics.timer('filter', company):
+            birthdays_df = self.filter_birthdays(confidential_df, status_df, dates, index)
+        self.metrics.incr('birthdays', company, len(birthdays_df))
+        if birthdays_df.empty:
+            return None
+
+        with self.metrics.timer('join', company):
+            recipients_df = self.join_email_data(birthdays_df, contact_df)
+        self.metrics.incr('recipients', company, len(recipients_df))
+        if recipients_df.empty:
+            self.logger.warning("No valid email addresses found for birthday recipients")
+            return None
+
+        if self.recipient_index is not None:
+            recipients_df = self._claim_recipients(recipients_df, excel_path, company)
+            if recipients_df.empty:
+                return None
+        return company, company_cfg, recipients_df
+
+    def _claim_recipients(self, recipients_df: pd.DataFrame, excel_path: str, company: str) -> pd.DataFrame:
+        """Claim this file's recipients in the run-wide index; people another company claimed are logged and dropped."""
+        emails = recipients_df['Email'].map(SendLedger.normalize)
+        if self.config['dedup_key'] == 'email_emp_id':
+            keys = list(zip(emails, recipients_df['Emp_Id'].astype(str).str.strip()))
+        else:
+            keys = [(email,) for email in emails]
+        owners = pd.Series(self.recipient_index.claim(company, keys), index=recipients_df.index)
+        duplicate = owners != company
+        if not duplicate.any():
+            return recipients_df
+
+        by_owner = owners[duplicate].value_counts()
+        self.logger.info(f"[{company}] Skipping {int(duplicate.sum())} recipient(s) already greeted by another "
+                         f"company this run ({', '.join(f'{owner}: {n}' for owner, n in by_owner.items())})")
+        self.metrics.incr('duplicates_skipped', company, int(duplicate.sum()))
+        for row, owner in zip(recipients_df[duplicate].itertuples(index=False), owners[duplicate]):
+            self.log_send_attempt(row.Email, row.Greeting_Name, excel_path, company, "Skipped (Duplicate)",
+                                  f"Greeted by {owner}", birthday_date=getattr(row, 'Birthday_Date', None))
+        return recipients_df[~duplicate]
+
+    def _dedup_rank(self, company: str) -> int:
+        """Position of `company` under DEDUP_PRECEDENCE: listed companies first, then registry order."""
+        precedence = self.config['dedup_precedence']
+        listed = [] if precedence.lower() in ('registry', 'first') else self._parse_list(precedence)
+        order = listed + [name for name in self.company_configs if name not in listed]
+        return order.index(company) if company in order else len(order)
+
+    def run(self, excel_files: List[str], dates: Optional[List[date]] = None):
+        """
+        Send birthday emails for every file. `dates` (default: today) may hold several days, e.g.
+        from date_range() or catch_up_dates(); each workbook is still read and sent only once.
+        """
+        dates = sorted(set(dates or [date.today()]))
         self.logger.info("Starting Birthday Email System (No-Batch)")
+        self.logger.info(f"Birthday date(s) for this run: {self._describe_dates(dates)}")
+        self._templates.clear()  # templates are rebuilt once per run
+        self.metrics = RunMetrics()
+        if self.config['dedup_across_companies']:
+            self.recipient_index = RecipientIndex()
+        try:
+            if self.config['run_mode'] == 'concurrent':
+                failed = self._run_concurrent(excel_files, dates)
+            else:
+                if self.config['run_mode'] != 'serial':
+                    self.logger.warning(f"Invalid RUN_MODE value: {self.config['run_mode']}. Using serial.")
+                failed = self._run_serial(excel_files, dates)
+        finally:
+            self.recipient_index = None
+            self.send_log.flush()
+            self.export_metrics()
+            self.save_rate_state()
+        if failed:
+            self.logger.warning(f"{len(failed)} file(s) failed; last successful run date left unchanged")
+        elif not self.config['dry_run'] and self.config['spool_stage'] != 'compose':
+            self._record_successful_run(dates)
+        self.logger.info("Birthday Email System completed")
+
+    # --- Run dates -------------------------------------------------------------------
+
+    @staticmethod
+    def date_range(start: date, end: date) -> List[date]:
+        """Every date from `start` to `end`, inclusive."""
+        return [start + timedelta(days=n) for n in range((end - start).days + 1)]
+
+    def catch_up_dates(self, until: Optional[date] = None) -> List[date]:
+        """
+        Dates since the last successful run up to `until` (default today), at most
+        CATCH_UP_MAX_DAYS of them. Just `until` when there is no earlier run on record.
+        """
+        until = until or date.today()
+        last = self.last_successful_run()
+        if last is None or last >= until:
+            return [until]
+        start = last + timedelta(days=1)
+        max_days = max(1, self.config['catch_up_max_days'])
+        if (until - start).days + 1 > max_days:
+            earliest = until - timedelta(days=max_days - 1)
+            self.logger.warning(f"Last successful run was {last.isoformat()}; catching up only from "
+                                f"{earliest.isoformat()} (CATCH_UP_MAX_DAYS={max_days})")
+            start = earliest
+        return self.date_range(start, until)
+
+    def last_successful_run(self) -> Optional[date]:
+        path = Path(self.config['run_state_file'])
+        if not path.exists():
+            return None
+        try:
+            return date.fromisoformat(json.loads(path.read_text(encoding='utf-8'))['last_successful_date'])
+        except Exception as e:
+            self.logger.warning(f"Could not read run state from {path}: {e}")
+            return None
+
+    def _record_successful_run(self, dates: List[date]):
+        """
+        Advance the last successful date through the days this run covered without a gap (and not
+        past today), so a one-off run for an older date never hides days that were missed.
+        """
+        covered = set(dates)
+        last = self.last_successful_run() or min(dates) - timedelta(days=1)
+        new_last = last
+        while new_last + timedelta(days=1) in covered and new_last < date.today():
+            new_last += timedelta(days=1)
+        if new_last == last:
+            return
+        try:
+            _write_atomic(self.config['run_state_file'], json.dumps({
+                'last_successful_date': new_last.isoformat(),
+                'completed_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }, indent=2))
+        except Exception as e:
+            self.logger.error(f"Could not write run state to {self.config['run_state_file']}: {e}")
+
+    def export_metrics(self):
+        json_file, prom_file = self.config['metrics_json_file'], self.config['metrics_prom_file']
+        try:
+            self.metrics.export(json_file, prom_file)
+        except Exception as e:
+            self.logger.error(f"Could not write run metrics: {e}")
+            return
+        if json_file or prom_file:
+            self.logger.info(f"Run metrics written to {', '.join(p for p in (json_file, prom_file) if p)}")
+
+    def _run_serial(self, excel_files: List[str], dates: List[date]) -> List[str]:
+        """
+        Process files one after another; returns the files that failed. With cross-company dedup
+        by precedence, files are taken in precedence order so the preferred company claims first.
+        """
+        failed = []
+        if self._dedup_ranked():
+            excel_files = sorted(excel_files, key=lambda f: self._dedup_rank(self._company_for_path(f)))
         for idx, excel_file in enumerate(excel_files):
             if not Path(excel_file).exists():
                 self.logger.error(f"File not found: {excel_file}")
+                failed.append(excel_file)
                 continue
             try:
-                self.process_file(excel_file)
+                self.process_file(excel_file, dates=dates)
             except Exception as e:
                 self.logger.error(f"Failed to process {excel_file}: {str(e)}")
+                failed.append(excel_file)
                 continue
 
-            # NEW: small delay between switching companies/files
-            if idx < len(excel_files) - 1:
+            # NEW: small delay between switching companies/files (adaptive pacing is per relay instead)
+            if idx < len(excel_files) - 1 and self.config['rate_control'] != 'adaptive':
                 self.logger.info(f"Pacing between company files for {self.config['delay_between_companies']} seconds...")
                 time.sleep(self.config['delay_between_companies'])
+        return failed
 
-        self.logger.info("Birthday Email System completed")
+    def _run_concurrent(self, excel_files: List[str], dates: List[date]) -> List[str]:
+        """
+        Parse workbooks in a process pool and hand each finished one to its own send thread.
+        Every company keeps its own SMTP session and pacing, so no delay between companies is
+        needed, and a failure in one company never stops the others. Returns the files that failed.
+        """
+        pending = {}
+        failed = []
+        for excel_file in excel_files:
+            if not Path(excel_file).exists():
+                self.logger.error(f"File not found: {excel_file}")
+                failed.append(excel_file)
+                continue
+            try:
+                company = self.detect_company_from_path(excel_file)
+                self.get_company_config(company)
+            except Exception as e:
+                self.logger.error(f"Failed to process {excel_file}: {str(e)}")
+                failed.append(excel_file)
+                continue
+            pending[excel_file] = company
+        if not pending:
+            return failed
+
+        parse_workers = max(1, min(self.config['parse_workers'], len(pending)))
+        send_workers = max(1, min(self.config['send_workers'], len(pending)))
+        self.logger.info(f"Concurrent run: {len(pending)} files, {parse_workers} parse workers, {send_workers} send workers")
+
+        with ProcessPoolExecutor(max_workers=parse_workers, initializer=_init_parse_worker) as parse_pool, \
+                ThreadPoolExecutor(max_workers=send_workers) as send_pool:
+            parse_futures = {parse_pool.submit(self._load_company_data_in_worker, f, dates): f for f in pending}
+            send_futures = {}
+            loaded = {}
+            for future in as_completed(parse_futures):
+                excel_file = parse_futures[future]
+                try:
+                    data, worker_metrics = future.result()
+                    self.metrics.merge(worker_metrics)
+                except Exception as e:
+                    self.logger.error(f"Failed to process {excel_file}: {str(e)}")
+                    failed.append(excel_file)
+                    continue
+                if data is None:
+                    continue
+                if self._dedup_ranked():
+                    loaded[excel_file] = data  # claimed in precedence order once every file is parsed
+                    continue
+                future = send_pool.submit(self._process_file_in_thread, excel_file, pending[excel_file], data, dates)
+                send_futures[future] = excel_file
+
+            for excel_file in sorted(loaded, key=lambda f: self._dedup_rank(pending[f])):
+                try:
+                    prepared = self.prepare_file(excel_file, loaded[excel_file], dates)
+                except Exception as e:
+                    self.logger.error(f"Failed to process {excel_file}: {str(e)}")
+                    failed.append(excel_file)
+                    continue
+                if prepared is not None:
+                    send_futures[send_pool.submit(self._send_file_in_thread, excel_file, prepared)] = excel_file
+
+            for future in as_completed(send_futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    self.logger.error(f"Failed to process {send_futures[future]}: {str(e)}")
+                    failed.append(send_futures[future])
+        return failed
+
+    def _process_file_in_thread(self, excel_path: str, company: str, data, dates: List[date]):
+        threading.current_thread().name = company
+        self.process_file(excel_path, data, dates)
+
+    def _send_file_in_thread(self, excel_path: str, prepared: tuple):
+        company, company_cfg, recipients_df = prepared
+        threading.current_thread().name = company
+        try:
+            self.send_emails(recipients_df, excel_path, company, company_cfg)
+        except Exception as e:
+            self.logger.error(f"Error processing file {excel_path}: {str(e)}")
+            raise
+
+    def _dedup_ranked(self) -> bool:
+        """Cross-company dedup is on and the sending company is chosen by precedence, not arrival."""
+        return self.recipient_index is not None and self.config['dedup_precedence'].lower() != 'first'
+
+    # --- Daemon mode -----------------------------------------------------------------
+
+    def run_daemon(self, excel_files: List[str], stop_event: Optional[threading.Event] = None):
+        """
+        Long-running alternative to a daily cron run. Each workbook is loaded once and kept in
+        memory, and is re-loaded only when its modification time or size changes. Each company's
+        emails go out once a day at its SEND_TIME in its TIMEZONE. SMTP sessions are opened
+        SMTP_WARMUP_MINUTES beforehand and health-checked on every poll until then. Runs until
+        `stop_event` is set (or the process is stopped).
+        """
+        stop_event = stop_event or threading.Event()
+        jobs = self._daemon_jobs(excel_files)
+        if not jobs:
+            self.logger.error("Daemon mode: no usable files; exiting")
+            return
+        self.logger.info(f"Daemon mode: watching {len(jobs)} file(s), polling every {self.config['daemon_poll_interval']}s")
+        for job in jobs:
+            self.logger.info(f"[{job['company']}] Sends daily at {job['hour']:02d}:{job['minute']:02d} "
+                             f"{job['cfg']['timezone'] or '(server time)'} from {Path(job['path']).name}")
+        try:
+            while not stop_event.is_set():
+                for job in jobs:
+                    try:
+                        self._daemon_tick(job)
+                    except Exception as e:
+                        self.logger.error(f"[{job['company']}] Daemon error for {job['path']}: {e}")
+                stop_event.wait(self.config['daemon_poll_interval'])
+        finally:
+            with self._warm_lock:
+                sessions = [server for servers in self._warm_sessions.values() for server in servers]
+                self._warm_sessions.clear()
+            for server in sessions:
+                self._close_smtp(server)
+            self.send_log.flush()
+            self.logger.info("Daemon mode stopped")
+
+    def _daemon_jobs(self, excel_files: List[str]) -> List[dict]:
+        """One schedule entry per workbook; files with a bad company config or schedule are skipped."""
+        jobs = []
+        for excel_file in excel_files:
+            try:
+                company = self.detect_company_from_path(excel_file)
+                cfg = self.get_company_config(company)
+                if cfg['schedule_error']:
+                    raise ValueError(cfg['schedule_error'])
+                hour, minute, tz = cfg['send_at']
+            except Exception as e:
+                self.logger.error(f"Daemon mode: skipping {excel_file}: {e}")
+                continue
+            jobs.append({'path': excel_file, 'company': company, 'cfg': cfg, 'hour': hour, 'minute': minute,
+                         'tz': tz, 'stamp': None, 'data': None, 'last_sent': None, 'retry_at': 0.0})
+        return jobs
+
+    def _daemon_tick(self, job: dict):
+        self._refresh_daemon_data(job)
+        now = datetime.now(job['tz']) if job['tz'] else datetime.now()
+        today = now.date()
+        if job['last_sent'] == today or job['data'] is None:
+            return
+        send_at = now.replace(hour=job['hour'], minute=job['minute'], second=0, microsecond=0)
+        if now >= send_at:
+            if time.monotonic() >= job['retry_at']:
+                self._daemon_send(job, today)
+        elif now >= send_at - timedelta(minutes=self.config['smtp_warmup_minutes']):
+            self._warm_up_smtp(job['cfg'])
+
+    def _refresh_daemon_data(self, job: dict):
+        """(Re)load a workbook into memory when its mtime/size differ from the copy already held."""
+        try:
+            stamp = self._source_stamp(job['path'])
+        except (OSError, ValueError) as e:
+            if job['stamp'] != 'missing':
+                kept = "; keeping the last loaded data" if job['data'] is not None else ""
+                self.logger.error(f"[{job['company']}] Cannot read {job['path']} ({e}){kept}")
+                job['stamp'] = 'missing'
+            return
+        if stamp == job['stamp']:
+            return
+        self.logger.info(f"[{job['company']}] {'Reloading changed' if job['data'] is not None else 'Loading'} {Path(job['path']).name}")
+        job['stamp'] = stamp  # a broken file is not retried until it changes again
+        confidential_df, contact_df, status_df = self.load_and_validate_data(job['path'])
+        index = self.load_birthday_index(job['path'], confidential_df)
+        job['data'] = (confidential_df, contact_df, status_df, index)
+
+    def _daemon_send(self, job: dict, today: date):
+        """
+        Send one company's birthdays for its local `today` from the in-memory data. Warm sessions
+        the send did not use (no birthdays today, or a smaller async pool) are closed afterwards
+        rather than left idle until the next warm-up.
+        """
+        thread = threading.current_thread()
+        thread_name, thread.name = thread.name, job['company']
+        self._templates.clear()
+        self.metrics = RunMetrics()
+        try:
+            self.process_file(job['path'], job['data'], [today])
+            job['last_sent'] = today
+        except Exception as e:
+            job['retry_at'] = time.monotonic() + self.config['daemon_retry_interval']
+            self.logger.error(f"[{job['company']}] Send failed ({e}); retrying in {self.config['daemon_retry_interval']:.0f}s")
+        finally:
+            with self._warm_lock:
+                leftover = self._warm_sessions.pop(job['company'], [])
+            for server in leftover:
+                self._close_smtp(server)
+            if leftover:
+                self.logger.info(f"[{job['company']}] Closed {len(leftover)} unused warm SMTP session(s)")
+            self.send_log.flush()
+            self.export_metrics()
+            self.save_rate_state()
+            thread.name = thread_name
+
+    def _warm_up_smtp(self, cfg: dict):
+        """Keep the company's warm sessions open and healthy (one, or SMTP_POOL_SIZE for the async engine)."""
+        if self.config['dry_run']:
+            return
+        company = cfg['company']
+        wanted = max(1, cfg['smtp_pool_size']) if self.config['send_engine'] == 'async' else 1
+        with self._warm_lock:
+            sessions = self._warm_sessions.pop(company, [])
+        healthy = []
+        for server in sessions:
+            if self._smtp_healthy(server):
+                healthy.append(server)
+            else:
+                self.logger.warning(f"[{company}] Warm SMTP session failed its health check; reopening")
+                self._close_smtp(server)
+        while len(healthy) < wanted:
+            try:
+                healthy.append(self._connect_smtp(cfg))
+            except Exception as e:
+                self.logger.warning(f"[{company}] Could not open warm SMTP session: {e}")
+                break
+        with self._warm_lock:
+            self._warm_sessions.setdefault(company, []).extend(healthy)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Send birthday emails from the company HR workbooks.")
+    when = parser.add_mutually_exclusive_group()
+    when.add_argument('--date', type=date.fromisoformat, metavar='YYYY-MM-DD',
+                      help="Send for this birthday date instead of today")
+    when.add_argument('--from', dest='start', type=date.fromisoformat, metavar='YYYY-MM-DD',
+                      help="Send for every date from this one through --to (default today)")
+    when.add_argument('--since-last-run', action='store_true',
+                      help="Send for every date since the last successful run (missed weekends/holidays)")
+    when.add_argument('--daemon', action='store_true',
+                      help="Keep running: send at each company's SEND_TIME, reloading workbooks when they change")
+    stage = parser.add_mutually_exclusive_group()
+    stage.add_argument('--compose-only', action='store_true',
+                       help="Compose the messages into the outbox spool (SPOOL_DIR) without sending them")
+    stage.add_argument('--send-spool', action='store_true',
+                       help="Send what is waiting in the outbox spool for the date(s); no workbook is read")
+    stage.add_argument('--prepare-cards', action='store_true',
+                       help="Build the optimized birthday-card variants (CARD_CACHE_DIR) and exit")
+    parser.add_argument('--rerun', action='store_true',
+                        help="Sharded sending: start an already finished run again (sends only what the "
+                             "resume ledger does not show as sent)")
+    parser.add_argument('--to', dest='end', type=date.fromisoformat, metavar='YYYY-MM-DD',
+                        help="Last date of a --from range")
+    parser.add_argument('files', nargs='*',
+                        help="Workbooks to process (default: WORKBOOK_GLOB or the registry's workbook_globs)")
+    args = parser.parse_args(argv)
+    if args.end and not args.start:
+        parser.error("--to requires --from")
+    if args.start and args.start > (args.end or date.today()):
+        parser.error("--from must not be after --to")
+    if args.daemon and (args.compose_only or args.send_spool or args.prepare_cards):
+        parser.error("--compose-only, --send-spool and --prepare-cards cannot be combined with --daemon")
+    if args.daemon and args.rerun:
+        parser.error("--rerun cannot be combined with --daemon")
+    return args
 
 
 def main():
-    # Example usage - update these as needed
-    excel_files = [
-        r"C:\path\to\your\excel_files\COMPANY1_MASTER_EXCEL_HR_2025.xlsx",
-        r"C:\path\to\your\excel_files\COMPANY2_MASTER_EXCEL_HR_2025.xlsx",
-        r"C:\path\to\your\excel_files\COMPANY3_MASTER_EXCEL_HR_2025.xlsx",
-        r"C:\path\to\your\excel_files\COMPANY4_MASTER_EXCEL_HR_2025.xlsx"
-    ]
+    args = parse_args()
+    # Turn SIGTERM into a normal exit so buffered send-log rows are flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
     try:
         app = BirthdayEmailSystem()
-        app.run(excel_files)
+        app.config['shard_rerun'] = args.rerun
+        if args.prepare_cards:
+            app.prepare_cards()
+            return
+        if args.since_last_run:
+            dates = app.catch_up_dates()
+        elif args.start:
+            dates = app.date_range(args.start, args.end or date.today())
+        else:
+            dates = [args.date or date.today()]
+        if args.send_spool:
+            app.send_spool(dates)
+            return
+        excel_files = args.files or app.discover_workbooks()
+        if not excel_files:
+            app.logger.error("No workbooks to process; pass file paths or set WORKBOOK_GLOB / workbook_globs")
+            sys.exit(1)
+        if args.daemon:
+            app.run_daemon(excel_files)
+            return
+        if args.compose_only:
+            app.config['spool_enabled'] = True
+            app.config['spool_stage'] = 'compose'
+        app.run(excel_files, dates)
     except Exception as e:
         logging.error(f"Fatal error: {str(e)}")
         sys.exit(1)